@@ -5,10 +5,13 @@ router = APIRouter(prefix="/api")
  
 # Import api submodules so their route decorators run and register handlers on `router`
 from . import auth  # noqa: F401  (imports for side-effects)
+from . import maintenance, metrics  # noqa: F401
 from .models import (
     aliases,
+    archives,
     dashboard, 
     management, 
     resolve, 
-    versions
+    versions,
+    uploads
 )
\ No newline at end of file
@@ -0,0 +1,23 @@
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+
+from app import reaper, verifier
+from app.api.auth import current_user_id
+from . import router
+
+
+@router.post("/maintenance/reap", status_code=202)
+async def trigger_reaper(dry_run: Optional[bool] = None, uid: int = Depends(current_user_id)):
+    """Start an orphaned-object reclamation pass; progress is under /api/metrics"""
+    if not reaper.trigger(dry_run):
+        raise HTTPException(409, "A reclamation pass is already running")
+    return {"ok": True, "dry_run": reaper.stats()["dry_run"] if dry_run is None else dry_run}
+
+
+@router.post("/maintenance/verify", status_code=202)
+async def trigger_verifier(uid: int = Depends(current_user_id)):
+    """Start a pass re-hashing stored files against their manifest; progress is under /api/metrics"""
+    if not verifier.trigger():
+        raise HTTPException(409, "A verification pass is already running")
+    return {"ok": True}
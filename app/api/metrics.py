@@ -0,0 +1,20 @@
+from app import disk_cache, disk_guard, promoter, reaper, singleflight, storage, sweeper, verifier
+from app.cache import dashboard_cache, resolve_cache
+from . import router
+
+
+@router.get("/metrics")
+async def metrics():
+    """In-process counters for the storage pool, caches and background jobs"""
+    return {
+        "storage": storage.stats(),
+        "resolve_cache": resolve_cache.stats(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "disk_cache": disk_cache.stats(),
+        "singleflight": singleflight.stats(),
+        "reaper": reaper.stats(),
+        "upload_sweeper": sweeper.stats(),
+        "upload_disk": disk_guard.stats(),
+        "verifier": verifier.stats(),
+        "blob_promotion": promoter.stats(),
+    }
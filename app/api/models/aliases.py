@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, Header, Response, Cookie,
 from fastapi.responses import StreamingResponse
 import tempfile
 import os
+from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import select
+from fastapi import Query
+from sqlalchemy import select, tuple_
 from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 
@@ -14,6 +16,9 @@ from app.model.model_version import ModelVersion
 from app.s3 import presign_put, upload_file, presign_get, create_multipart_upload, presign_upload_part, complete_multipart_upload, abort_multipart_upload, list_multipart_uploads
 from app.api import router
 from app.api.auth import current_user_id
+from app import revisions
+from app.cache import invalidate_models
+from app.pagination import MAX_PAGE_SIZE, decode_cursor, paginate
 
 
 @router.post("/models/{name}/aliases/{alias}")
@@ -42,21 +47,46 @@ async def set_alias(
         existing.version_id = mv.id
     else:
         db.add(ModelAlias(model_id=m.id, alias=alias, version_id=mv.id))
+    await revisions.bump_models(db, m)
     await db.commit()
+    invalidate_models(m)
     return {"ok": True}
 
 @router.get("/models/{name}/aliases")
-async def get_aliases(name: str, db: Session = Depends(get_db)):
-    """Get all aliases for a model"""
+async def get_aliases(
+    name: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Get aliases for a model, most recently updated first"""
+    not_modified = await revisions.conditional(db, request, response, revisions.model_scope(name))
+    if not_modified:
+        return not_modified
+
     m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
     if not m:
         raise HTTPException(404, "Model not found")
     
-    aliases = (await db.execute(
-        select(ModelAlias, ModelVersion).join(ModelVersion).where(
-            ModelAlias.model_id == m.id
-        ).order_by(ModelAlias.updated_at.desc())
-    )).all()
+    query = select(ModelAlias, ModelVersion).join(ModelVersion).where(
+        ModelAlias.model_id == m.id
+    ).order_by(ModelAlias.updated_at.desc(), ModelAlias.id.desc())
+    if cursor:
+        last_updated_at, last_id = decode_cursor(cursor, str, int)
+        try:
+            last_updated_at = datetime.fromisoformat(last_updated_at)
+        except (TypeError, ValueError):
+            raise HTTPException(400, "Invalid cursor")
+        query = query.where(
+            tuple_(ModelAlias.updated_at, ModelAlias.id) < tuple_(last_updated_at, last_id)
+        )
+    if limit:
+        query = query.limit(limit + 1)
+
+    aliases = (await db.execute(query)).all()
+    aliases = paginate(aliases, limit, response, lambda row: (row[0].updated_at.isoformat(), row[0].id))
     
     return [
         {
@@ -88,5 +118,7 @@ async def delete_alias(
         raise HTTPException(404, "Alias not found")
     
     await db.delete(existing)
+    await revisions.bump_models(db, m)
     await db.commit()
+    invalidate_models(m)
     return {"ok": True}
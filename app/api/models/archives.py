@@ -0,0 +1,96 @@
+from fastapi import Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from sqlalchemy import select
+
+from app.main import get_db
+from app.model.model import Model
+from app.model.model_alias import ModelAlias
+from app.model.model_version import ModelVersion
+from app import archive, manifest
+from app.api import router
+from app.api.models.resolve import resolve_group_variant_version
+
+_FORMATS = {
+    "tar": ("application/x-tar", archive.tar_length, archive.stream_tar),
+    "zip": ("application/zip", archive.zip_length, archive.stream_zip),
+}
+
+
+async def _archive_response(db, mv, basename: str, format: str):
+    if format not in _FORMATS:
+        raise HTTPException(400, "Format must be 'tar' or 'zip'")
+    entries = await manifest.ensure(db, mv)
+    if not entries:
+        raise HTTPException(404, "No files found for this version")
+    manifest.ensure_intact(entries)
+
+    media_type, length, stream = _FORMATS[format]
+    return StreamingResponse(
+        stream(entries),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={basename}.{format}",
+            "Content-Length": str(length(entries)),
+        },
+    )
+
+
+@router.get("/models/{name}/versions/{version}/archive")
+async def download_version_archive(
+    name: str,
+    version: int,
+    format: str = "tar",
+    db = Depends(get_db),
+):
+    """Every file of a version as one streamed, uncompressed tar or zip64 archive"""
+    m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
+    if not m:
+        raise HTTPException(404, "Model not found")
+
+    mv = (await db.execute(
+        select(ModelVersion).where(
+            ModelVersion.model_id == m.id,
+            ModelVersion.version == version
+        )
+    )).scalar_one_or_none()
+    if not mv:
+        raise HTTPException(404, "Version not found")
+
+    return await _archive_response(db, mv, f"{name}-v{version}", format)
+
+
+@router.get("/models/{name}/aliases/{alias}/archive")
+async def download_alias_archive(
+    name: str,
+    alias: str,
+    format: str = "tar",
+    db = Depends(get_db),
+):
+    """Archive of the version an alias points at"""
+    row = (await db.execute(
+        select(Model, ModelVersion)
+        .join(ModelAlias, ModelAlias.model_id == Model.id)
+        .join(ModelVersion, ModelVersion.id == ModelAlias.version_id)
+        .where(Model.name == name, ModelAlias.alias == alias)
+    )).first()
+    if not row:
+        raise HTTPException(404, f"Alias '{alias}' not found for model {name}")
+    m, mv = row
+
+    return await _archive_response(db, mv, f"{name}-v{mv.version}", format)
+
+
+@router.get("/resolve/{group_name}/{variant}/archive")
+async def download_resolved_archive(
+    group_name: str,
+    variant: str,
+    alias: Optional[str] = None,
+    version: Optional[int] = None,
+    format: str = "tar",
+    db = Depends(get_db),
+):
+    """Archive of the version a group:variant@alias|vN reference resolves to"""
+    m, mv = await resolve_group_variant_version(db, group_name, variant, alias, version)
+
+    return await _archive_response(db, mv, f"{m.name}-v{mv.version}", format)
@@ -3,7 +3,9 @@ from fastapi.responses import StreamingResponse
 import tempfile
 import os
 from typing import List, Optional
-from sqlalchemy import select
+from datetime import datetime, timedelta
+from sqlalchemy import JSON, distinct, func, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 
@@ -14,99 +16,103 @@ from app.model.model_version import ModelVersion
 from app.s3 import presign_put, upload_file, presign_get, create_multipart_upload, presign_upload_part, complete_multipart_upload, abort_multipart_upload, list_multipart_uploads
 from app.api import router
 from app.api.auth import current_user_id
+from app.cache import dashboard_cache
 
-@router.get("/dashboard/stats")
-async def dashboard_stats(uid: int = Depends(current_user_id), db: Session = Depends(get_db)):
-    """Get dashboard statistics for logged-in users"""
-    from sqlalchemy import func, distinct
-    
-    
-    total_models = (await db.execute(select(func.count(Model.id)))).scalar()
-    
-    
-    total_groups = (await db.execute(select(func.count(distinct(Model.group_name))))).scalar()
-    
-    
-    total_versions = (await db.execute(select(func.count(ModelVersion.id)))).scalar()
-    
-    
-    total_aliases = (await db.execute(select(func.count(ModelAlias.id)))).scalar()
-    
-    
-    from datetime import datetime, timedelta
+def _json_list(query, order_by, **fields):
+    """Aggregate a subquery's rows into an ordered JSON array inside the statement"""
+    sub = query.subquery()
+    row = func.json_build_object(*[
+        part for key, column in fields.items() for part in (key, sub.c[column])
+    ])
+    return select(
+        func.coalesce(
+            func.json_agg(aggregate_order_by(row, *[o(sub) for o in order_by])),
+            literal_column("'[]'::json"),
+            type_=JSON,
+        )
+    ).scalar_subquery()
+
+
+def _stats_statement():
+    """Every dashboard figure as one row from a single round trip"""
     seven_days_ago = datetime.now() - timedelta(days=7)
-    recent_models = (await db.execute(
+    version_count = func.count(ModelVersion.id).label("version_count")
+    return select(
+        select(func.count(Model.id)).scalar_subquery().label("total_models"),
+        select(func.count(distinct(Model.group_name))).scalar_subquery().label("total_groups"),
+        select(func.count(ModelVersion.id)).scalar_subquery().label("total_versions"),
+        select(func.count(ModelAlias.id)).scalar_subquery().label("total_aliases"),
         select(func.count(Model.id)).where(Model.created_at >= seven_days_ago)
-    )).scalar()
-    
-    
-    recent_versions = (await db.execute(
+            .scalar_subquery().label("recent_models"),
         select(func.count(ModelVersion.id)).where(ModelVersion.created_at >= seven_days_ago)
-    )).scalar()
-    
-    
-    top_groups = (await db.execute(
-        select(
-            Model.group_name,
-            func.count(ModelVersion.id).label('version_count')
-        )
-        .join(ModelVersion)
-        .group_by(Model.group_name)
-        .order_by(func.count(ModelVersion.id).desc())
-        .limit(5)
-    )).all()
-    
-    
-    latest_models = (await db.execute(
-        select(Model)
-        .order_by(Model.created_at.desc())
-        .limit(5)
-    )).scalars().all()
-    
-    
-    latest_versions = (await db.execute(
-        select(ModelVersion, Model)
-        .join(Model)
-        .order_by(ModelVersion.created_at.desc())
-        .limit(5)
-    )).all()
-    
-    return {
+            .scalar_subquery().label("recent_versions"),
+        _json_list(
+            select(Model.group_name, version_count)
+            .join(ModelVersion)
+            .group_by(Model.group_name)
+            .order_by(version_count.desc())
+            .limit(5),
+            [lambda sub: sub.c.version_count.desc()],
+            group_name="group_name",
+            version_count="version_count",
+        ).label("top_groups"),
+        _json_list(
+            select(Model.name, Model.group_name, Model.variant, Model.description, Model.created_at)
+            .order_by(Model.created_at.desc())
+            .limit(5),
+            [lambda sub: sub.c.created_at.desc()],
+            name="name",
+            group_name="group_name",
+            variant="variant",
+            description="description",
+            created_at="created_at",
+        ).label("latest_models"),
+        _json_list(
+            select(
+                Model.name.label("model_name"),
+                Model.group_name,
+                Model.variant,
+                ModelVersion.version,
+                ModelVersion.created_at,
+            )
+            .select_from(ModelVersion)
+            .join(Model)
+            .order_by(ModelVersion.created_at.desc())
+            .limit(5),
+            [lambda sub: sub.c.created_at.desc()],
+            model_name="model_name",
+            group_name="group_name",
+            variant="variant",
+            version="version",
+            created_at="created_at",
+        ).label("latest_versions"),
+    )
+
+
+@router.get("/dashboard/stats")
+async def dashboard_stats(uid: int = Depends(current_user_id), db: Session = Depends(get_db)):
+    """Get dashboard statistics for logged-in users"""
+    cached = dashboard_cache.get("stats")
+    if cached is not None:
+        return cached
+    generation = dashboard_cache.generation
+
+    stats = (await db.execute(_stats_statement())).one()
+
+    payload = {
         "totals": {
-            "models": total_models or 0,
-            "groups": total_groups or 0,
-            "versions": total_versions or 0,
-            "aliases": total_aliases or 0,
+            "models": stats.total_models or 0,
+            "groups": stats.total_groups or 0,
+            "versions": stats.total_versions or 0,
+            "aliases": stats.total_aliases or 0,
         },
         "recent": {
-            "models": recent_models or 0,
-            "versions": recent_versions or 0,
+            "models": stats.recent_models or 0,
+            "versions": stats.recent_versions or 0,
         },
-        "top_groups": [
-            {
-                "group_name": group.group_name,
-                "version_count": group.version_count
-            }
-            for group in top_groups
-        ],
-        "latest_models": [
-            {
-                "name": m.name,
-                "group_name": m.group_name,
-                "variant": m.variant,
-                "description": m.description,
-                "created_at": m.created_at.isoformat() if m.created_at else None,
-            }
-            for m in latest_models
-        ],
-        "latest_versions": [
-            {
-                "model_name": model.name,
-                "group_name": model.group_name,
-                "variant": model.variant,
-                "version": version.version,
-                "created_at": version.created_at.isoformat() if version.created_at else None,
-            }
-            for version, model in latest_versions
-        ]
-    }
\ No newline at end of file
+        "top_groups": stats.top_groups,
+        "latest_models": stats.latest_models,
+        "latest_versions": stats.latest_versions,
+    }
+    dashboard_cache.set("stats", payload, generation=generation)
+    return payload
@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, Header, Response, Cookie,
 from fastapi.responses import StreamingResponse
 import tempfile
 import os
+from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import select
+from fastapi import Query
+from sqlalchemy import and_, delete, func, select, tuple_
 from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 
@@ -11,9 +13,13 @@ from app.main import Session, get_db
 from app.model.model import Model
 from app.model.model_alias import ModelAlias
 from app.model.model_version import ModelVersion
+from app.model.upload_session import UploadPart, UploadSession
 from app.s3 import presign_put, upload_file, presign_get, create_multipart_upload, presign_upload_part, complete_multipart_upload, abort_multipart_upload, list_multipart_uploads
 from app.api import router
 from app.api.auth import current_user_id
+from app import manifest, revisions
+from app.cache import invalidate_models
+from app.pagination import MAX_PAGE_SIZE, decode_cursor, paginate
 
 
 class CreateModelRequest(BaseModel):
@@ -37,6 +43,8 @@ async def create_model(
     )
     db.add(m)
     try:
+        # The revision bump autoflushes the new row, so a duplicate name fails here
+        await revisions.bump_models(db, m)
         await db.commit()
     except IntegrityError:
         await db.rollback()
@@ -44,8 +52,35 @@ async def create_model(
     return {"ok": True}
 
 @router.get("/models")
-async def list_models(db: Session = Depends(get_db)):
-    models = (await db.execute(select(Model))).scalars().all()
+async def list_models(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    group_name: Optional[str] = None,
+    variant: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+):
+    not_modified = await revisions.conditional(db, request, response, revisions.REGISTRY)
+    if not_modified:
+        return not_modified
+
+    query = select(Model).order_by(Model.id)
+    if group_name is not None:
+        query = query.where(Model.group_name == group_name)
+    if variant is not None:
+        query = query.where(Model.variant == variant)
+    if created_after is not None:
+        query = query.where(Model.created_at > created_after)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.where(Model.id > last_id)
+    if limit:
+        query = query.limit(limit + 1)
+
+    models = (await db.execute(query)).scalars().all()
+    models = paginate(models, limit, response, lambda m: (m.id,))
     return [
         {
             "id": m.id,
@@ -60,42 +95,81 @@ async def list_models(db: Session = Depends(get_db)):
     ]
 
 @router.get("/models/groups")
-async def list_model_groups(db: Session = Depends(get_db)):
-    """Get models grouped by group_name with their variants and latest aliases"""
-    from sqlalchemy import func
-    
-    
-    models_query = select(Model).order_by(Model.group_name, Model.variant)
-    models = (await db.execute(models_query)).scalars().all()
-    
+async def list_model_groups(
+    request: Request,
+    response: Response,
+    group_name: Optional[str] = None,
+    variant: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Get models grouped by group_name with their variants and latest aliases.
+
+    Pages are cut by variant, so a group may continue on the next page.
+    """
+    not_modified = await revisions.conditional(db, request, response, revisions.REGISTRY)
+    if not_modified:
+        return not_modified
+
+    filters = []
+    if group_name is not None:
+        filters.append(Model.group_name == group_name)
+    if variant is not None:
+        filters.append(Model.variant == variant)
+    if cursor:
+        last_group, last_variant, last_id = decode_cursor(cursor, str, str, int)
+        filters.append(
+            tuple_(Model.group_name, Model.variant, Model.id) > tuple_(last_group, last_variant, last_id)
+        )
+    model_ids = select(Model.id).where(*filters)
+    if limit:
+        # Restrict the aggregates to the models on this page
+        model_ids = model_ids.order_by(Model.group_name, Model.variant, Model.id).limit(limit + 1)
+
+    # Version counts and the most recently updated alias for every model in one
+    # query, instead of two queries per model
+    version_counts = (
+        select(ModelVersion.model_id, func.count(ModelVersion.id).label("version_count"))
+        .where(ModelVersion.model_id.in_(model_ids))
+        .group_by(ModelVersion.model_id)
+        .subquery()
+    )
+    ranked_aliases = (
+        select(
+            ModelAlias.model_id,
+            ModelAlias.alias,
+            func.row_number().over(
+                partition_by=ModelAlias.model_id,
+                order_by=(ModelAlias.updated_at.desc(), ModelAlias.id.desc()),
+            ).label("alias_rank"),
+        )
+        .where(ModelAlias.model_id.in_(model_ids))
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(Model, version_counts.c.version_count, ranked_aliases.c.alias)
+        .outerjoin(version_counts, version_counts.c.model_id == Model.id)
+        .outerjoin(ranked_aliases, and_(
+            ranked_aliases.c.model_id == Model.id, ranked_aliases.c.alias_rank == 1
+        ))
+        .where(Model.id.in_(model_ids))
+        .order_by(Model.group_name, Model.variant, Model.id)
+    )).all()
+    rows = paginate(rows, limit, response, lambda row: (row[0].group_name, row[0].variant, row[0].id))
     
     groups = {}
-    for model in models:
-        group_name = model.group_name
-        if group_name not in groups:
-            groups[group_name] = {
-                "group_name": group_name,
-                "variants": []
-            }
-        
-        
-        latest_alias_query = select(ModelAlias).where(
-            ModelAlias.model_id == model.id
-        ).order_by(ModelAlias.updated_at.desc()).limit(1)
-        latest_alias = (await db.execute(latest_alias_query)).scalar_one_or_none()
-        
-        
-        version_count_query = select(func.count(ModelVersion.id)).where(
-            ModelVersion.model_id == model.id
-        )
-        version_count = (await db.execute(version_count_query)).scalar()
-        
-        groups[group_name]["variants"].append({
+    for model, version_count, latest_alias in rows:
+        group = groups.setdefault(model.group_name, {
+            "group_name": model.group_name,
+            "variants": []
+        })
+        group["variants"].append({
             "id": model.id,
             "name": model.name,
             "variant": model.variant,
             "description": model.description,
-            "latest_alias": latest_alias.alias if latest_alias else None,
+            "latest_alias": latest_alias,
             "version_count": version_count or 0,
             "created_at": model.created_at.isoformat() if model.created_at else None,
         })
@@ -103,8 +177,12 @@ async def list_model_groups(db: Session = Depends(get_db)):
     return list(groups.values())
 
 @router.get("/models/{name}")
-async def get_model(name: str, db: Session = Depends(get_db)):
+async def get_model(name: str, request: Request, response: Response, db: Session = Depends(get_db)):
     """Get detailed information about a specific model"""
+    not_modified = await revisions.conditional(db, request, response, revisions.model_scope(name))
+    if not_modified:
+        return not_modified
+
     m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
     if not m:
         raise HTTPException(404, "Model not found")
@@ -120,15 +198,39 @@ async def get_model(name: str, db: Session = Depends(get_db)):
     }
 
 @router.get("/models/{name}/versions")
-async def get_model_versions(name: str, db: Session = Depends(get_db)):
-    """Get all versions for a specific model"""
+async def get_model_versions(
+    name: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    tag: List[str] = Query([]),
+    db: Session = Depends(get_db),
+):
+    """Get versions for a specific model, newest first.
+
+    Each ``tag=key:value`` narrows the result to versions whose tag matches.
+    """
     m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
     if not m:
         raise HTTPException(404, "Model not found")
     
-    versions = (await db.execute(
-        select(ModelVersion).where(ModelVersion.model_id == m.id).order_by(ModelVersion.version.desc())
-    )).scalars().all()
+    query = select(ModelVersion).where(ModelVersion.model_id == m.id).order_by(ModelVersion.version.desc())
+    if created_after is not None:
+        query = query.where(ModelVersion.created_at > created_after)
+    for predicate in tag:
+        key, sep, value = predicate.partition(":")
+        if not sep or not key:
+            raise HTTPException(400, "Tag filters must look like key:value")
+        query = query.where(ModelVersion.tags[key].as_string() == value)
+    if cursor:
+        (last_version,) = decode_cursor(cursor, int)
+        query = query.where(ModelVersion.version < last_version)
+    if limit:
+        query = query.limit(limit + 1)
+
+    versions = (await db.execute(query)).scalars().all()
+    versions = paginate(versions, limit, response, lambda v: (v.version,))
     
     return [
         {
@@ -141,6 +243,37 @@ async def get_model_versions(name: str, db: Session = Depends(get_db)):
         for v in versions
     ]
 
+async def _delete_models(db, model_ids):
+    """Delete models with their aliases and versions using bulk statements.
+
+    Aliases, upload bookkeeping and manifests go first because they reference versions;
+    the caller commits, so the whole cleanup is one short transaction.
+    """
+    version_ids = select(ModelVersion.id).where(ModelVersion.model_id.in_(model_ids))
+    session_ids = select(UploadSession.id).where(UploadSession.version_id.in_(version_ids))
+    await db.execute(
+        delete(UploadPart).where(UploadPart.session_id.in_(session_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    await db.execute(
+        delete(UploadSession).where(UploadSession.version_id.in_(version_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    await manifest.delete_for_versions(db, version_ids)
+    aliases = await db.execute(
+        delete(ModelAlias).where(ModelAlias.model_id.in_(model_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    versions = await db.execute(
+        delete(ModelVersion).where(ModelVersion.model_id.in_(model_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    await db.execute(
+        delete(Model).where(Model.id.in_(model_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    return aliases.rowcount, versions.rowcount
+
 @router.delete("/models/{name}")
 async def delete_model(
     name: str,
@@ -152,28 +285,17 @@ async def delete_model(
     if not m:
         raise HTTPException(404, "Model not found")
     
-    
-    aliases = (await db.execute(
-        select(ModelAlias).where(ModelAlias.model_id == m.id)
-    )).scalars().all()
-    for alias in aliases:
-        await db.delete(alias)
-    
-    
-    versions = (await db.execute(
-        select(ModelVersion).where(ModelVersion.model_id == m.id)
-    )).scalars().all()
-    for version in versions:
-        await db.delete(version)
-    
-    # Flush to ensure foreign key references are removed before deleting the model
-    await db.flush()
-    
-    
-    await db.delete(m)
+    deleted_aliases, deleted_versions = await _delete_models(db, [m.id])
+    await revisions.bump_models(db, m)
     await db.commit()
+    invalidate_models(m)
     
-    return {"ok": True, "message": f"Model {name} deleted successfully"}
+    return {
+        "ok": True,
+        "message": f"Model {name} deleted successfully",
+        "deleted_versions": deleted_versions,
+        "deleted_aliases": deleted_aliases
+    }
 
 @router.delete("/models/groups/{group_name}")
 async def delete_model_group(
@@ -186,37 +308,18 @@ async def delete_model_group(
     if not models:
         raise HTTPException(404, "Model group not found")
     
-    deleted_models = []
+    deleted_aliases, deleted_versions = await _delete_models(db, [model.id for model in models])
+    deleted_models = [f"{model.group_name}:{model.variant}" for model in models]
     
-    # Process each model in the group
-    for model in models:
-        # Delete aliases for this model
-        aliases = (await db.execute(
-            select(ModelAlias).where(ModelAlias.model_id == model.id)
-        )).scalars().all()
-        for alias in aliases:
-            await db.delete(alias)
-        
-        # Delete versions for this model
-        versions = (await db.execute(
-            select(ModelVersion).where(ModelVersion.model_id == model.id)
-        )).scalars().all()
-        for version in versions:
-            await db.delete(version)
-        
-        # Flush to ensure foreign key references are removed
-        await db.flush()
-        
-        # Now delete the model itself
-        await db.delete(model)
-        deleted_models.append(f"{model.group_name}:{model.variant}")
-    
-    # Final commit for all changes
+    await revisions.bump_models(db, *models)
     await db.commit()
+    invalidate_models(*models)
     
     return {
         "ok": True, 
         "message": f"Model group {group_name} deleted successfully",
         "deleted_models": deleted_models,
-        "count": len(deleted_models)
-    }
\ No newline at end of file
+        "count": len(deleted_models),
+        "deleted_versions": deleted_versions,
+        "deleted_aliases": deleted_aliases
+    }
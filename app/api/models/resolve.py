@@ -3,7 +3,8 @@ from fastapi.responses import StreamingResponse
 import tempfile
 import os
 from typing import List, Optional
-from sqlalchemy import select
+from sqlalchemy import Integer, String, and_, cast, column, func, null, or_, select, values
+from sqlalchemy.orm import aliased
 from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 
@@ -14,105 +15,281 @@ from app.model.model_version import ModelVersion
 from app.s3 import presign_put, upload_file, presign_get, create_multipart_upload, presign_upload_part, complete_multipart_upload, abort_multipart_upload, list_multipart_uploads
 from app.api import router
 from app.api.auth import current_user_id
+from app.api.models.versions import presigned_files
+from app import revisions, singleflight
+from app.cache import resolve_cache
+from app.model.registry_revision import RegistryRevision
+
+# Upper bound on references accepted by /resolve/batch
+MAX_BATCH_REFS = 1000
+
+# Concurrent cache misses for the same reference share one lookup; keys
+# carry the cache generation so no caller joins a lookup older than an invalidation
+_inflight = singleflight.group("resolve")
 
-@router.get("/models/{name}/resolve")
-async def resolve(name: str, version: Optional[int] = None, alias: Optional[str] = None,
-                  db: Session = Depends(get_db)):
-    m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
-    if not m:
-        raise HTTPException(404, "Model not found")
 
+def _resolve_statement(model_clause, alias: Optional[str], version: Optional[int]):
+    """One query returning (Model, ModelVersion, alias id) for a lookup.
+
+    Outer joins keep the model row when the alias or version is missing, so
+    callers can tell "model not found" from "alias/version not found".
+    """
+    if alias:
+        return (
+            select(Model, ModelVersion, ModelAlias.id)
+            .outerjoin(ModelAlias, and_(ModelAlias.model_id == Model.id, ModelAlias.alias == alias))
+            .outerjoin(ModelVersion, ModelVersion.id == ModelAlias.version_id)
+            .where(model_clause)
+        )
     if version is not None:
-        mv = (await db.execute(
-            select(ModelVersion).where(
-                ModelVersion.model_id == m.id, ModelVersion.version == version
-            )
-        )).scalar_one_or_none()
-    elif alias:
-        a = (await db.execute(
-            select(ModelAlias).where(
-                ModelAlias.model_id == m.id, ModelAlias.alias == alias
-            )
-        )).scalar_one_or_none()
-        if not a:
-            raise HTTPException(404, "Alias not found")
-        mv = (await db.execute(
-            select(ModelVersion).where(ModelVersion.id == a.version_id)
-        )).scalar_one()
-    else:
-        raise HTTPException(400, "Provide version or alias")
+        return (
+            select(Model, ModelVersion, null())
+            .outerjoin(ModelVersion, and_(ModelVersion.model_id == Model.id, ModelVersion.version == version))
+            .where(model_clause)
+        )
+    return (
+        select(Model, ModelVersion, null())
+        .outerjoin(ModelVersion, ModelVersion.model_id == Model.id)
+        .where(model_clause)
+        .order_by(ModelVersion.version.desc().nulls_last())
+        .limit(1)
+    )
 
-    if not mv:
-        raise HTTPException(404, "Version not found")
 
+def _group_payload(m, mv, group_name: str, variant: str, alias: Optional[str]):
     return {
-        "name": name,
+        "name": m.name,
         "group_name": m.group_name,
         "variant": m.variant,
         "version": mv.version,
         "s3_prefix": f"s3://{settings.S3_BUCKET}/{mv.s3_prefix}",
         "endpoint": settings.S3_ENDPOINT,
-        "display_name": f"{m.group_name}:{m.variant}@{alias}" if alias else f"{m.group_name}:{m.variant}@v{mv.version}",
+        "display_name": f"{group_name}:{variant}@{alias}" if alias else f"{group_name}:{variant}@v{mv.version}",
     }
 
+
+def _cached_response(request: Request, response: Response, cached):
+    payload, etag = cached
+    not_modified = revisions.not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    response.headers["ETag"] = etag
+    return payload
+
+
+@router.get("/models/{name}/resolve")
+async def resolve(name: str, request: Request, response: Response,
+                  version: Optional[int] = None, alias: Optional[str] = None):
+    cache_key = ("name", name, alias, version)
+    cached = resolve_cache.get(cache_key)
+    if cached is not None:
+        return _cached_response(request, response, cached)
+    generation = resolve_cache.generation
+
+    if version is None and not alias:
+        raise HTTPException(400, "Provide version or alias")
+
+    async def lookup():
+        async with Session() as db:
+            scope = revisions.model_scope(name)
+            etag = revisions.make_etag(scope, await revisions.current(db, scope), f"{alias}|{version}")
+
+            # An explicit version wins over the alias for this endpoint
+            row = (await db.execute(
+                _resolve_statement(Model.name == name, None if version is not None else alias, version)
+            )).first()
+        if not row:
+            raise HTTPException(404, "Model not found")
+        m, mv, alias_id = row
+        if version is None and alias_id is None:
+            raise HTTPException(404, "Alias not found")
+        if not mv:
+            raise HTTPException(404, "Version not found")
+
+        payload = {
+            "name": name,
+            "group_name": m.group_name,
+            "variant": m.variant,
+            "version": mv.version,
+            "s3_prefix": f"s3://{settings.S3_BUCKET}/{mv.s3_prefix}",
+            "endpoint": settings.S3_ENDPOINT,
+            "display_name": f"{m.group_name}:{m.variant}@{alias}" if alias else f"{m.group_name}:{m.variant}@v{mv.version}",
+        }
+        resolve_cache.set(cache_key, (payload, etag), generation=generation)
+        return payload, etag
+
+    return _cached_response(request, response, await _inflight.do((generation, cache_key), lookup))
+
+async def resolve_group_variant_version(
+    db,
+    group_name: str,
+    variant: str,
+    alias: Optional[str] = None,
+    version: Optional[int] = None,
+):
+    """Find the model and version a group:variant@alias|vN reference points at"""
+    row = (await db.execute(
+        _resolve_statement(
+            and_(Model.group_name == group_name, Model.variant == variant), alias, version
+        )
+    )).first()
+    if not row:
+        raise HTTPException(404, f"Model {group_name}:{variant} not found")
+
+    m, mv, alias_id = row
+    if alias and alias_id is None:
+        raise HTTPException(404, f"Alias '{alias}' not found for {group_name}:{variant}")
+    if not mv:
+        if version is not None and not alias:
+            raise HTTPException(404, f"Version {version} not found for {group_name}:{variant}")
+        raise HTTPException(404, f"No versions found for {group_name}:{variant}")
+
+    return m, mv
+
 @router.get("/resolve/{group_name}/{variant}")
 async def resolve_by_group_variant(
     group_name: str, 
     variant: str,
+    request: Request,
+    response: Response,
     alias: Optional[str] = None,
     version: Optional[int] = None,
-    db: Session = Depends(get_db)
 ):
     """Resolve model by group:variant@alias format (e.g., Bielik:7b@Prod)"""
-    
-    
-    model_name = f"{group_name}:{variant}"
-    m = (await db.execute(
-        select(Model).where(
-            Model.group_name == group_name, 
-            Model.variant == variant
-        )
-    )).scalar_one_or_none()
-    
-    if not m:
-        raise HTTPException(404, f"Model {group_name}:{variant} not found")
+    cache_key = ("group", group_name, variant, alias, version)
+    cached = resolve_cache.get(cache_key)
+    if cached is not None:
+        return _cached_response(request, response, cached)
+    generation = resolve_cache.generation
+
+    async def lookup():
+        async with Session() as db:
+            scope = revisions.variant_scope(group_name, variant)
+            etag = revisions.make_etag(scope, await revisions.current(db, scope), f"{alias}|{version}")
+            m, mv = await resolve_group_variant_version(db, group_name, variant, alias, version)
+
+        payload = _group_payload(m, mv, group_name, variant, alias)
+        resolve_cache.set(cache_key, (payload, etag), generation=generation)
+        return payload, etag
+
+    return _cached_response(request, response, await _inflight.do((generation, cache_key), lookup))
+
+
+class BatchResolveRequest(BaseModel):
+    refs: List[str]
+
+
+def parse_ref(ref: str):
+    """Split "group:variant@alias", "group:variant@vN" or "group:variant"."""
+    target, _, selector = ref.rpartition("@") if "@" in ref else (ref, "", "")
+    group_name, sep, variant = target.rpartition(":")
+    if not sep or not group_name or not variant:
+        raise ValueError(f"Invalid reference '{ref}', expected group:variant@alias|vN")
+    if selector[:1] == "v" and selector[1:].isdigit():
+        return group_name, variant, None, int(selector[1:])
+    return group_name, variant, selector or None, None
 
-    
-    if alias:
-        a = (await db.execute(
-            select(ModelAlias).where(
-                ModelAlias.model_id == m.id, ModelAlias.alias == alias
-            )
-        )).scalar_one_or_none()
-        if not a:
-            raise HTTPException(404, f"Alias '{alias}' not found for {group_name}:{variant}")
-        mv = (await db.execute(
-            select(ModelVersion).where(ModelVersion.id == a.version_id)
-        )).scalar_one()
-    elif version is not None:
-        mv = (await db.execute(
-            select(ModelVersion).where(
-                ModelVersion.model_id == m.id, ModelVersion.version == version
-            )
-        )).scalar_one_or_none()
-        if not mv:
-            raise HTTPException(404, f"Version {version} not found for {group_name}:{variant}")
-    else:
-        
-        mv = (await db.execute(
-            select(ModelVersion).where(
-                ModelVersion.model_id == m.id
-            ).order_by(ModelVersion.version.desc()).limit(1)
-        )).scalar_one_or_none()
-        if not mv:
-            raise HTTPException(404, f"No versions found for {group_name}:{variant}")
+
+def _batch_statement(pending):
+    """Resolve (idx, group, variant, alias, version) tuples in one query"""
+    refs = values(
+        column("idx", Integer),
+        column("group_name", String),
+        column("variant", String),
+        column("alias", String),
+        column("version", Integer),
+        name="refs",
+    ).data(pending)
+    latest = aliased(ModelVersion)
+    latest_version = (
+        select(func.max(latest.version))
+        .where(latest.model_id == Model.id)
+        .scalar_subquery()
+    )
+    # A VALUES column holding only NULLs is typed as text, so cast explicitly
+    ref_version = cast(refs.c.version, Integer)
+    return (
+        select(refs.c.idx, Model, ModelVersion, ModelAlias.id, RegistryRevision.revision)
+        .select_from(refs)
+        .outerjoin(RegistryRevision, RegistryRevision.scope == func.concat(
+            "variant:", refs.c.group_name, ":", refs.c.variant
+        ))
+        .outerjoin(Model, and_(Model.group_name == refs.c.group_name, Model.variant == refs.c.variant))
+        .outerjoin(ModelAlias, and_(ModelAlias.model_id == Model.id, ModelAlias.alias == refs.c.alias))
+        .outerjoin(ModelVersion, and_(
+            ModelVersion.model_id == Model.id,
+            or_(
+                and_(refs.c.alias.isnot(None), ModelVersion.id == ModelAlias.version_id),
+                and_(refs.c.alias.is_(None), ref_version.isnot(None), ModelVersion.version == ref_version),
+                and_(refs.c.alias.is_(None), ref_version.is_(None), ModelVersion.version == latest_version),
+            ),
+        ))
+    )
+
+
+@router.post("/resolve/batch")
+async def resolve_batch(body: BatchResolveRequest, db: Session = Depends(get_db)):
+    """Resolve many group:variant@alias|vN references with one set-based query"""
+    if len(body.refs) > MAX_BATCH_REFS:
+        raise HTTPException(400, f"At most {MAX_BATCH_REFS} references per batch")
+
+    results = [None] * len(body.refs)
+    pending = []
+    generation = resolve_cache.generation
+    for idx, ref in enumerate(body.refs):
+        try:
+            group_name, variant, alias, version = parse_ref(ref)
+        except ValueError as e:
+            results[idx] = {"ref": ref, "status": 400, "error": str(e)}
+            continue
+        cached = resolve_cache.get(("group", group_name, variant, alias, version))
+        if cached is not None:
+            results[idx] = {"ref": ref, "status": 200, "result": cached[0]}
+        else:
+            pending.append((idx, group_name, variant, alias, version))
+
+    if pending:
+        rows = (await db.execute(_batch_statement(pending))).all()
+
+        by_idx = {idx: (group_name, variant, alias, version) for idx, group_name, variant, alias, version in pending}
+        for idx, m, mv, alias_id, revision in rows:
+            group_name, variant, alias, version = by_idx[idx]
+            ref = body.refs[idx]
+            if m is None:
+                results[idx] = {"ref": ref, "status": 404, "error": f"Model {group_name}:{variant} not found"}
+            elif alias and alias_id is None:
+                results[idx] = {"ref": ref, "status": 404, "error": f"Alias '{alias}' not found for {group_name}:{variant}"}
+            elif mv is None:
+                error = f"Version {version} not found for {group_name}:{variant}" if version is not None \
+                    else f"No versions found for {group_name}:{variant}"
+                results[idx] = {"ref": ref, "status": 404, "error": error}
+            else:
+                payload = _group_payload(m, mv, group_name, variant, alias)
+                etag = revisions.make_etag(
+                    revisions.variant_scope(group_name, variant), revision or 0, f"{alias}|{version}"
+                )
+                resolve_cache.set(("group", group_name, variant, alias, version), (payload, etag), generation=generation)
+                results[idx] = {"ref": ref, "status": 200, "result": payload}
+
+    return {"results": results}
+
+@router.get("/resolve/{group_name}/{variant}/presign")
+async def presign_resolved_files(
+    group_name: str,
+    variant: str,
+    alias: Optional[str] = None,
+    version: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Presigned download URLs for every file of the version a reference resolves to"""
+    m, mv = await resolve_group_variant_version(db, group_name, variant, alias, version)
 
     return {
         "name": m.name,
         "group_name": m.group_name,
         "variant": m.variant,
         "version": mv.version,
-        "s3_prefix": f"s3://{settings.S3_BUCKET}/{mv.s3_prefix}",
-        "endpoint": settings.S3_ENDPOINT,
         "display_name": f"{group_name}:{variant}@{alias}" if alias else f"{group_name}:{variant}@v{mv.version}",
-    }
\ No newline at end of file
+        "valid_for": settings.PRESIGN_CACHE_MARGIN,
+        "files": await presigned_files(db, mv),
+    }
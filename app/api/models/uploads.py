@@ -0,0 +1,691 @@
+from fastapi import Depends, Header, HTTPException, Request, UploadFile, File
+import os
+import tarfile
+from typing import List, Optional
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from pydantic import BaseModel
+
+from app.main import get_db, settings
+from app.model.model import Model
+from app.model.model_version import ModelVersion
+from app.model.upload_session import UploadPart, UploadSession
+from app import manifest, promoter, storage, sweeper, unpack
+from app.api import router
+from app.api.auth import current_user_id
+from app.api.models.versions import delete_version
+
+# S3 rejects multipart parts smaller than this, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PRESIGN_BATCH = 1000
+
+
+class InitiateMultipartRequest(BaseModel):
+    filename: str
+    content_type: str = "application/octet-stream"
+    # With content-addressed storage, the SHA-256 of the whole file
+    sha256: Optional[str] = None
+
+
+class PresignPartsRequest(BaseModel):
+    start: int = 1
+    count: int = 100
+
+
+class CompletedPart(BaseModel):
+    part_number: int
+    etag: str
+
+
+class CompleteMultipartRequest(BaseModel):
+    parts: List[CompletedPart]
+
+
+class BlobCheckRequest(BaseModel):
+    digests: List[str]
+
+
+class LinkedFile(BaseModel):
+    filename: str
+    sha256: str
+
+
+class LinkFilesRequest(BaseModel):
+    files: List[LinkedFile]
+
+
+def _part_ranges(parts, checksum: str):
+    """Collapse (part_number, size, checksum) rows, sorted by part number, into ranges.
+
+    Consecutive parts of equal size share one entry, so a finished 10,000 part
+    upload with a fixed chunk size is described by a single range plus its
+    checksums in part order.
+    """
+    ranges = []
+    for number, size, digest in parts:
+        last = ranges[-1] if ranges else None
+        if last and last["end"] == number - 1 and last["size"] == size:
+            last["end"] = number
+            last[checksum].append(digest)
+        else:
+            ranges.append({"start": number, "end": number, "size": size, checksum: [digest]})
+    return ranges
+
+
+def _status_payload(session, parts, checksum: str):
+    return {
+        "filename": session.filename,
+        "s3_key": session.s3_key,
+        "status": session.status,
+        "expires_at": session.expires_at.isoformat() if session.expires_at else None,
+        "received_parts": len(parts),
+        "received_bytes": sum(size for _, size, _ in parts),
+        "ranges": _part_ranges(parts, checksum),
+    }
+
+
+async def _declared_version(db, name: str, version: int):
+    m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
+    if not m:
+        raise HTTPException(404, "Model not found")
+
+    mv = (await db.execute(
+        select(ModelVersion).where(
+            ModelVersion.model_id == m.id,
+            ModelVersion.version == version
+        )
+    )).scalar_one_or_none()
+    if not mv:
+        raise HTTPException(404, "Version not declared")
+    return m, mv
+
+
+async def _active_session(db, name: str, version: int, kind: str):
+    """Model, version and in-progress upload session of the given kind, in one query"""
+    row = (await db.execute(
+        select(Model, ModelVersion, UploadSession)
+        .outerjoin(ModelVersion, (ModelVersion.model_id == Model.id) & (ModelVersion.version == version))
+        .outerjoin(UploadSession, (UploadSession.version_id == ModelVersion.id)
+                   & (UploadSession.kind == kind) & (UploadSession.status == "uploading"))
+        .where(Model.name == name)
+        .order_by(UploadSession.id.desc())
+        .limit(1)
+    )).first()
+    if not row:
+        raise HTTPException(404, "Model not found")
+    m, mv, session = row
+    if not mv:
+        raise HTTPException(404, "Version not found")
+    if not session:
+        raise HTTPException(400, f"Invalid {kind} upload")
+    return m, mv, session
+
+
+def _declared_digest(body: InitiateMultipartRequest):
+    """Client-declared SHA-256 of the whole file, checked against the bytes once they are stored"""
+    if not body.sha256:
+        return None
+    digest = body.sha256.strip().lower()
+    if not manifest.valid_digest(digest):
+        raise HTTPException(400, "sha256 must be 64 hex characters")
+    return digest
+
+
+async def _link_stored(db, mv, body: InitiateMultipartRequest, digest: str, kind: str):
+    """Complete an upload at once by linking a blob that is already stored"""
+    existing = (await manifest.stored_blobs(db, [digest])).get(digest)
+    if existing is None:
+        return None
+
+    await manifest.record(
+        db, mv, body.filename, existing.s3_key, existing.size,
+        body.content_type, existing.etag, digest, verified=True
+    )
+    s3_url = f"s3://{settings.S3_BUCKET}/{existing.s3_key}"
+    tags = mv.tags.copy() if mv.tags else {}
+    tags.update({
+        f"{kind}_upload": True,
+        "filename": body.filename,
+        "content_type": body.content_type,
+        "status": "completed",
+        "s3_url": s3_url,
+        "total_size": existing.size,
+        "total_chunks": 0
+    })
+    mv.tags = tags
+    await db.commit()
+    return {
+        "s3_prefix": mv.s3_prefix,
+        "s3_key": existing.s3_key,
+        "s3_url": s3_url,
+        "sha256": digest,
+        "size": existing.size,
+        "deduplicated": True,
+        "message": "File already stored, linked without uploading"
+    }
+
+
+async def _start_session(db, mv, kind: str, body: InitiateMultipartRequest, digest: Optional[str]):
+    """Open a multipart upload for the version, replacing any unfinished one"""
+    previous = (await db.execute(
+        select(UploadSession).where(
+            UploadSession.version_id == mv.id, UploadSession.status == "uploading"
+        )
+    )).scalars().all()
+    for session in previous:
+        try:
+            await storage.abort_multipart_upload(session.s3_key, session.upload_id)
+        except Exception as abort_error:
+            print(f"Warning: Failed to abort previous multipart upload: {abort_error}")
+        session.status = "aborted"
+    if previous:
+        await db.execute(delete(UploadPart).where(UploadPart.session_id.in_([s.id for s in previous])))
+
+    # Content-addressed uploads are staged under the version; their blob is
+    # only created once the promoter has hashed the assembled object
+    if settings.CONTENT_ADDRESSED_STORAGE:
+        key = manifest.staging_key(mv, body.filename)
+    else:
+        key = f"{mv.s3_prefix}/{body.filename}"
+    upload_id = await storage.create_multipart_upload(key, body.content_type)
+    session = UploadSession(
+        version_id=mv.id,
+        kind=kind,
+        s3_key=key,
+        upload_id=upload_id,
+        filename=body.filename,
+        content_type=body.content_type,
+        status="uploading",
+        sha256=digest,
+        expires_at=sweeper.expiry(),
+    )
+    db.add(session)
+
+    # Keep the version tags describing the upload for listings
+    tags = mv.tags.copy() if mv.tags else {}
+    tags.update({
+        f"{kind}_upload": True,
+        "filename": body.filename,
+        "content_type": body.content_type,
+        "status": "uploading"
+    })
+    mv.tags = tags
+    await db.commit()
+    return session
+
+
+async def _finish_session(db, mv, session, total_size: int, total_chunks: int, etag: str):
+    s3_url = f"s3://{settings.S3_BUCKET}/{session.s3_key}"
+    session.status = "completed"
+    await db.execute(delete(UploadPart).where(UploadPart.session_id == session.id))
+    # The digest is the one declared at initiate, if any, and stays untrusted
+    # until the server hashes the assembled object: the promoter does so for
+    # content-addressed uploads, the verifier for the rest
+    await manifest.record(
+        db, mv, session.filename, session.s3_key, total_size,
+        session.content_type, etag, session.sha256,
+        pending_blob=settings.CONTENT_ADDRESSED_STORAGE
+    )
+
+    tags = mv.tags.copy()
+    tags.update({
+        "status": "completed",
+        "s3_url": s3_url,
+        "total_size": total_size,
+        "total_chunks": total_chunks
+    })
+    mv.tags = tags
+    await db.commit()
+    if settings.CONTENT_ADDRESSED_STORAGE:
+        promoter.trigger()
+    return s3_url
+
+
+@router.post("/models/{name}/versions/{version}/chunked/initiate")
+async def initiate_chunked_upload(
+    name: str,
+    version: int,
+    body: InitiateMultipartRequest,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db)
+):
+    """Initiate chunked upload for a new version"""
+    # The version must already be declared by the client
+    m, mv = await _declared_version(db, name, version)
+
+    digest = _declared_digest(body)
+    if digest and settings.CONTENT_ADDRESSED_STORAGE:
+        linked = await _link_stored(db, mv, body, digest, "chunked")
+        if linked:
+            return linked
+
+    try:
+        # Chunks are forwarded to S3 as parts of this multipart upload as they arrive
+        session = await _start_session(db, mv, "chunked", body, digest)
+
+        return {
+            "s3_prefix": mv.s3_prefix,
+            "s3_key": session.s3_key,
+            "chunk_size": 100 * 1024 * 1024,  # 100MB recommended
+            "min_chunk_size": MIN_PART_SIZE,
+            "max_chunks": 10000
+        }
+    except Exception as e:
+        raise HTTPException(500, f"Failed to initiate chunked upload: {str(e)}")
+
+@router.put("/models/{name}/versions/{version}/chunks/{chunk_number}")
+async def upload_chunk(
+    name: str,
+    version: int,
+    chunk_number: int,
+    chunk: UploadFile = File(...),
+    chunk_sha256: Optional[str] = Header(None, alias="X-Chunk-SHA256"),
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Upload a file chunk to S3 as one part of the multipart upload.
+
+    The form parser spools the chunk to a temporary file first (the disk
+    guard watches that volume); it is hashed and streamed to S3 from there
+    and gone once the request ends, so no chunk outlives its request.
+
+    Idempotent: re-sending a chunk the server already holds with the same
+    checksum is acknowledged without touching S3. When the client sends
+    X-Chunk-SHA256 the received bytes must match it.
+    """
+    if chunk_number < 1 or chunk_number > 10000:
+        raise HTTPException(400, "Chunk number must be between 1 and 10000")
+
+    m, mv, session = await _active_session(db, name, version, "chunked")
+
+    chunk.file.seek(0, os.SEEK_END)
+    total_size = chunk.file.tell()
+    chunk.file.seek(0)
+
+    digest = await storage.sha256_fileobj(chunk.file)
+    if chunk_sha256 and chunk_sha256.strip().lower() != digest:
+        raise HTTPException(400, f"Checksum mismatch for chunk {chunk_number}")
+
+    existing = (await db.execute(
+        select(UploadPart).where(
+            UploadPart.session_id == session.id,
+            UploadPart.part_number == chunk_number
+        )
+    )).scalar_one_or_none()
+    if existing and existing.sha256 == digest and existing.size == total_size:
+        return {
+            "chunk_number": chunk_number,
+            "size": total_size,
+            "etag": existing.etag,
+            "sha256": digest,
+            "skipped": True,
+            "message": f"Chunk {chunk_number} already uploaded"
+        }
+
+    try:
+        etag = await storage.upload_part(
+            session.s3_key, session.upload_id, chunk_number, chunk.file, total_size
+        )
+
+        # One row per part; re-sent chunks replace their row, and concurrent
+        # chunks of the same upload never contend for the same record
+        values = {"size": total_size, "etag": etag, "sha256": digest}
+        await db.execute(
+            insert(UploadPart)
+            .values(session_id=session.id, part_number=chunk_number, **values)
+            .on_conflict_do_update(
+                index_elements=[UploadPart.session_id, UploadPart.part_number],
+                set_=values,
+            )
+        )
+        # Every received chunk pushes the session's expiry forward
+        await db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session.id)
+            .values(expires_at=sweeper.expiry())
+        )
+        await db.commit()
+
+        return {
+            "chunk_number": chunk_number,
+            "size": total_size,
+            "etag": etag,
+            "sha256": digest,
+            "skipped": False,
+            "message": f"Chunk {chunk_number} uploaded successfully"
+        }
+
+    except Exception as e:
+        raise HTTPException(500, f"Failed to upload chunk {chunk_number}: {str(e)}")
+
+@router.get("/models/{name}/versions/{version}/chunked/status")
+async def chunked_upload_status(
+    name: str,
+    version: int,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Chunks received so far, so an interrupted client re-sends only the missing ones"""
+    m, mv, session = await _active_session(db, name, version, "chunked")
+
+    parts = (await db.execute(
+        select(UploadPart.part_number, UploadPart.size, UploadPart.sha256)
+        .where(UploadPart.session_id == session.id)
+        .order_by(UploadPart.part_number)
+    )).all()
+    return _status_payload(session, [tuple(p) for p in parts], "sha256")
+
+@router.post("/models/{name}/versions/{version}/chunked/complete")
+async def complete_chunked_upload(
+    name: str,
+    version: int,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Complete the S3 multipart upload from the recorded part ETags"""
+    m, mv, session = await _active_session(db, name, version, "chunked")
+
+    parts = (await db.execute(
+        select(UploadPart.part_number, UploadPart.etag, UploadPart.size)
+        .where(UploadPart.session_id == session.id)
+        .order_by(UploadPart.part_number)
+    )).all()
+    if not parts:
+        raise HTTPException(400, "No chunks uploaded yet")
+
+    try:
+        # S3 assembles the object from the parts; no bytes pass through the API here
+        completed = await storage.complete_multipart_upload(
+            session.s3_key,
+            session.upload_id,
+            [{"PartNumber": part.part_number, "ETag": part.etag} for part in parts],
+        )
+        total_size = sum(part.size for part in parts)
+        s3_url = await _finish_session(
+            db, mv, session, total_size, len(parts), completed.get("ETag")
+        )
+
+        return {
+            "version": version,
+            "s3_key": session.s3_key,
+            "s3_prefix": mv.s3_prefix,
+            "s3_url": s3_url,
+            "total_size": total_size,
+            "total_chunks": len(parts),
+            "message": f"Successfully completed multipart upload of {len(parts)} chunks"
+        }
+
+    except Exception as e:
+        raise HTTPException(500, f"Failed to complete chunked upload: {str(e)}")
+
+@router.delete("/models/{name}/versions/{version}/chunked/abort")
+async def abort_chunked_upload(
+    name: str,
+    version: int,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Abort chunked upload and discard the uploaded parts"""
+    m, mv, session = await _active_session(db, name, version, "chunked")
+
+    try:
+        try:
+            await storage.abort_multipart_upload(session.s3_key, session.upload_id)
+        except Exception as cleanup_error:
+            # Log cleanup error but don't fail the abort
+            print(f"Warning: Failed to abort multipart upload: {cleanup_error}")
+
+        # Delete the model version record
+        await delete_version(db, m, mv)
+
+        return {"message": "Chunked upload aborted successfully"}
+    except Exception as e:
+        raise HTTPException(500, f"Failed to abort chunked upload: {str(e)}")
+
+
+@router.post("/models/{name}/versions/{version}/multipart/initiate")
+async def initiate_direct_upload(
+    name: str,
+    version: int,
+    body: InitiateMultipartRequest,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Start a multipart upload whose parts the client PUTs straight to S3"""
+    m, mv = await _declared_version(db, name, version)
+
+    digest = _declared_digest(body)
+    if digest and settings.CONTENT_ADDRESSED_STORAGE:
+        linked = await _link_stored(db, mv, body, digest, "direct")
+        if linked:
+            return linked
+
+    try:
+        session = await _start_session(db, mv, "direct", body, digest)
+
+        return {
+            "s3_prefix": mv.s3_prefix,
+            "s3_key": session.s3_key,
+            "upload_id": session.upload_id,
+            "chunk_size": 100 * 1024 * 1024,  # 100MB recommended
+            "min_chunk_size": MIN_PART_SIZE,
+            "max_chunks": 10000,
+            "max_presign_batch": MAX_PRESIGN_BATCH,
+            "expires_in": settings.S3_PRESIGN_EXPIRES
+        }
+    except Exception as e:
+        raise HTTPException(500, f"Failed to initiate direct upload: {str(e)}")
+
+@router.post("/models/{name}/versions/{version}/multipart/parts")
+async def presign_direct_upload_parts(
+    name: str,
+    version: int,
+    body: PresignPartsRequest,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Hand out a batch of presigned part upload URLs"""
+    if body.count < 1 or body.count > MAX_PRESIGN_BATCH:
+        raise HTTPException(400, f"Count must be between 1 and {MAX_PRESIGN_BATCH}")
+    if body.start < 1 or body.start + body.count - 1 > 10000:
+        raise HTTPException(400, "Part numbers must be between 1 and 10000")
+
+    m, mv, session = await _active_session(db, name, version, "direct")
+
+    # S3 never tells us about direct parts, so handing out URLs counts as activity
+    session.expires_at = sweeper.expiry()
+    await db.commit()
+
+    part_numbers = list(range(body.start, body.start + body.count))
+    urls = await storage.presign_upload_parts(
+        session.s3_key, session.upload_id, part_numbers, settings.S3_PRESIGN_EXPIRES
+    )
+    return {
+        "upload_id": session.upload_id,
+        "expires_in": settings.S3_PRESIGN_EXPIRES,
+        "parts": [
+            {"part_number": num, "url": url}
+            for num, url in zip(part_numbers, urls)
+        ]
+    }
+
+@router.get("/models/{name}/versions/{version}/multipart/status")
+async def direct_upload_status(
+    name: str,
+    version: int,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Parts S3 has received for a direct upload, with their ETags"""
+    m, mv, session = await _active_session(db, name, version, "direct")
+
+    try:
+        received = await storage.list_parts(session.s3_key, session.upload_id)
+    except Exception as e:
+        raise HTTPException(500, f"Failed to list uploaded parts: {str(e)}")
+
+    parts = sorted((p["PartNumber"], p["Size"], p["ETag"]) for p in received)
+    payload = _status_payload(session, parts, "etag")
+    payload["upload_id"] = session.upload_id
+    return payload
+
+@router.post("/models/{name}/versions/{version}/multipart/complete")
+async def complete_direct_upload(
+    name: str,
+    version: int,
+    body: CompleteMultipartRequest,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Complete a direct upload from the part ETags reported by the client"""
+    if not body.parts:
+        raise HTTPException(400, "No parts provided")
+
+    m, mv, session = await _active_session(db, name, version, "direct")
+
+    parts = [
+        {"PartNumber": p.part_number, "ETag": p.etag}
+        for p in sorted(body.parts, key=lambda p: p.part_number)
+    ]
+    try:
+        await storage.complete_multipart_upload(session.s3_key, session.upload_id, parts)
+        head = await storage.head_object(session.s3_key)
+        s3_url = await _finish_session(
+            db, mv, session, head["ContentLength"], len(parts), head["ETag"]
+        )
+
+        return {
+            "version": version,
+            "s3_key": session.s3_key,
+            "s3_prefix": mv.s3_prefix,
+            "s3_url": s3_url,
+            "total_size": head["ContentLength"],
+            "total_chunks": len(parts),
+            "message": f"Successfully completed direct upload of {len(parts)} parts"
+        }
+    except Exception as e:
+        raise HTTPException(500, f"Failed to complete direct upload: {str(e)}")
+
+@router.delete("/models/{name}/versions/{version}/multipart/abort")
+async def abort_direct_upload(
+    name: str,
+    version: int,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Abort a direct upload and discard the uploaded parts"""
+    m, mv, session = await _active_session(db, name, version, "direct")
+
+    try:
+        try:
+            await storage.abort_multipart_upload(session.s3_key, session.upload_id)
+        except Exception as cleanup_error:
+            print(f"Warning: Failed to abort multipart upload: {cleanup_error}")
+
+        await delete_version(db, m, mv)
+
+        return {"message": "Direct upload aborted successfully"}
+    except Exception as e:
+        raise HTTPException(500, f"Failed to abort direct upload: {str(e)}")
+
+@router.post("/models/{name}/versions/{version}/archive")
+async def upload_archive(
+    name: str,
+    version: int,
+    request: Request,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Upload a whole directory as one tar stream, stored member by member under the version"""
+    m, mv = await _declared_version(db, name, version)
+
+    try:
+        uploaded_files = await unpack.expand_tar(request.stream(), mv.s3_prefix)
+    except (tarfile.TarError, unpack.UnsafeMemberError) as e:
+        await delete_version(db, m, mv)
+        raise HTTPException(400, f"Invalid tar stream: {str(e)}")
+    except Exception as e:
+        await delete_version(db, m, mv)
+        raise HTTPException(500, f"Archive upload failed: {str(e)}")
+
+    for f in uploaded_files:
+        await manifest.record(
+            db, mv, f["filename"], f["s3_key"], f["size"],
+            f["content_type"], f["etag"], f["sha256"], verified=True
+        )
+    await db.commit()
+
+    return {
+        "version": version,
+        "s3_prefix": mv.s3_prefix,
+        "uploaded_files": uploaded_files,
+        "message": f"Successfully uploaded {len(uploaded_files)} files for version {version}"
+    }
+
+@router.post("/blobs/check")
+async def check_blobs(
+    body: BlobCheckRequest,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Which SHA-256 digests are already stored, so clients upload only the rest"""
+    digests = list(dict.fromkeys(d.strip().lower() for d in body.digests))
+    if len(digests) > MAX_PRESIGN_BATCH:
+        raise HTTPException(400, f"At most {MAX_PRESIGN_BATCH} digests per request")
+    if not all(manifest.valid_digest(d) for d in digests):
+        raise HTTPException(400, "Digests must be 64 hex characters")
+
+    stored = await manifest.stored_blobs(db, digests)
+    return {
+        "present": [d for d in digests if d in stored],
+        "missing": [d for d in digests if d not in stored],
+    }
+
+@router.post("/models/{name}/versions/{version}/files/link")
+async def link_files(
+    name: str,
+    version: int,
+    body: LinkFilesRequest,
+    uid: int = Depends(current_user_id),
+    db = Depends(get_db),
+):
+    """Add already stored blobs to a version's manifest without uploading them"""
+    if not body.files:
+        raise HTTPException(400, "No files provided")
+    if len(body.files) > MAX_PRESIGN_BATCH:
+        raise HTTPException(400, f"At most {MAX_PRESIGN_BATCH} files per request")
+    digests = [f.sha256.strip().lower() for f in body.files]
+    if not all(manifest.valid_digest(d) for d in digests):
+        raise HTTPException(400, "Digests must be 64 hex characters")
+
+    m, mv = await _declared_version(db, name, version)
+
+    stored = await manifest.stored_blobs(db, set(digests))
+    missing = sorted(set(digests) - set(stored))
+    if missing:
+        raise HTTPException(409, f"Digests not stored: {', '.join(missing)}")
+
+    linked = []
+    for f, digest in zip(body.files, digests):
+        blob = stored[digest]
+        await manifest.record(
+            db, mv, f.filename, blob.s3_key, blob.size, blob.content_type, blob.etag, digest,
+            verified=True
+        )
+        linked.append({"filename": f.filename, "sha256": digest, "size": blob.size, "s3_key": blob.s3_key})
+    await db.commit()
+
+    return {
+        "version": version,
+        "linked_files": linked,
+        "message": f"Linked {len(linked)} stored files into version {version}"
+    }
+
+@router.get("/multipart/uploads")
+async def list_ongoing_uploads(uid: int = Depends(current_user_id)):
+    """List ongoing multipart uploads"""
+    try:
+        uploads = await storage.list_multipart_uploads()
+        return uploads
+    except Exception as e:
+        raise HTTPException(500, f"Failed to list uploads: {str(e)}")
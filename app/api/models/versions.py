@@ -1,18 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, Header, Response, Cookie, Request, UploadFile, File
-from fastapi.responses import StreamingResponse
-import tempfile
-import os
+from fastapi.responses import RedirectResponse, StreamingResponse
+import asyncio
+import posixpath
+import uuid
 from typing import List, Optional
-from sqlalchemy import select
+from urllib.parse import quote
+from sqlalchemy import delete, select
 from sqlalchemy.exc import IntegrityError
-from pydantic import BaseModel
 
 from app.main import Session, get_db, settings
 from app.model.model import Model
 from app.model.model_version import ModelVersion
-from app.s3 import presign_put, upload_file, presign_get, create_multipart_upload, presign_upload_part, complete_multipart_upload, abort_multipart_upload, list_multipart_uploads
+from app.model.upload_session import UploadPart, UploadSession
+from app import disk_cache, manifest, proxy, ranges, revisions, singleflight, storage
 from app.api import router
 from app.api.auth import current_user_id
+from app.cache import invalidate_models
+
+# Identical concurrent listings and download lookups share one computation
+_listings = singleflight.group("listing")
+_downloads = singleflight.group("download")
 
 @router.post("/models/{name}/versions/declare")
 async def declare_version(
@@ -37,7 +44,9 @@ async def declare_version(
     prefix = f"{name}/versions/{ver}"
     mv = ModelVersion(model_id=m.id, version=ver, s3_prefix=prefix, tags={})
     db.add(mv)
+    await revisions.bump_models(db, m)
     await db.commit()
+    invalidate_models(m)
 
     return {
         "version": ver,
@@ -45,6 +54,17 @@ async def declare_version(
         "message": f"Declared new version {ver} for model {name}"
     }
 
+async def delete_version(db, m, mv):
+    """Remove a version together with its upload bookkeeping and commit"""
+    sessions = select(UploadSession.id).where(UploadSession.version_id == mv.id)
+    await db.execute(delete(UploadPart).where(UploadPart.session_id.in_(sessions)))
+    await db.execute(delete(UploadSession).where(UploadSession.version_id == mv.id))
+    await manifest.delete_for_versions(db, [mv.id])
+    await db.delete(mv)
+    await revisions.bump_models(db, m)
+    await db.commit()
+    invalidate_models(m)
+
 @router.post("/models/{name}/versions/new")
 async def create_version(
     name: str,
@@ -68,38 +88,67 @@ async def create_version(
     if not mv:
         raise HTTPException(404, "Version not declared")
 
-    
-    uploaded_files = []
-    try:
-        prefix = mv.s3_prefix
-        for file in files:
-            
-            file_content = await file.read()
-            
-            
-            key = f"{prefix}/{file.filename}"
-            
-            
-            s3_url = upload_file(
-                file_content=file_content,
-                key=key,
-                content_type=file.content_type or "application/octet-stream"
-            )
-            
-            uploaded_files.append({
+    prefix = mv.s3_prefix
+    limit = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+
+    # Hash every file on the storage pool first: the digest goes into the
+    # manifest, and in content-addressed mode bodies already stored are linked
+    # instead of uploaded again
+    digests = await asyncio.gather(*(storage.sha256_fileobj(file.file) for file in files))
+    stored = {}
+    if settings.CONTENT_ADDRESSED_STORAGE:
+        stored = await manifest.stored_blobs(db, set(digests))
+
+    async def upload_one(file: UploadFile, digest: str):
+        # The form parser has already spooled the part to disk; stream it from
+        # there in bounded pieces instead of reading it into memory
+        async with limit:
+            started.add(asyncio.current_task())
+            content_type = file.content_type or "application/octet-stream"
+            if settings.CONTENT_ADDRESSED_STORAGE:
+                key = manifest.blob_key(digest)
+            else:
+                key = f"{prefix}/{file.filename}"
+            existing = stored.get(digest)
+            if existing:
+                size, etag = existing.size, existing.etag
+            else:
+                await storage.upload_fileobj(file.file, key, content_type)
+                head = await storage.head_object(key)
+                size, etag = head["ContentLength"], head["ETag"]
+            return {
                 "filename": file.filename,
-                "size": len(file_content),
+                "size": size,
                 "s3_key": key,
-                "s3_url": s3_url,
-                "content_type": file.content_type
-            })
-    
+                "s3_url": f"s3://{settings.S3_BUCKET}/{key}",
+                "content_type": content_type,
+                "sha256": digest,
+                "etag": etag,
+                "deduplicated": existing is not None
+            }
+
+    started = set()
+    tasks = [asyncio.create_task(upload_one(file, digest)) for file, digest in zip(files, digests)]
+    try:
+        uploaded_files = await asyncio.gather(*tasks)
     except Exception as e:
-        
-        await db.delete(mv)
-        await db.commit()
+        # Cancelling a task does not stop a transfer already running on the S3
+        # pool, so only queued uploads are cancelled and the rest are awaited:
+        # nothing may land under the version once it is deleted
+        for task in tasks:
+            if task not in started:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await delete_version(db, m, mv)
         raise HTTPException(500, f"File upload failed: {str(e)}")
 
+    for f in uploaded_files:
+        await manifest.record(
+            db, mv, f["filename"], f["s3_key"], f["size"],
+            f["content_type"], f["etag"], f["sha256"], verified=True
+        )
+    await db.commit()
+
     return {
         "version": version,
         "s3_prefix": mv.s3_prefix,
@@ -108,67 +157,73 @@ async def create_version(
     }
 
 
-class InitiateMultipartRequest(BaseModel):
-    filename: str
-    content_type: str = "application/octet-stream"
-
-
-@router.post("/models/{name}/versions/{version}/chunked/initiate")
-async def initiate_chunked_upload(
+@router.get("/models/{name}/versions/{version}/download")
+async def list_version_files(
     name: str,
     version: int,
-    body: InitiateMultipartRequest,
-    uid: int = Depends(current_user_id),
-    db = Depends(get_db)
 ):
-    """Initiate chunked upload for a new version"""
-    m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
-    if not m:
-        raise HTTPException(404, "Model not found")
-    # The version must already be declared by the client. Update its tags to mark chunked upload.
-    mv = (await db.execute(
-        select(ModelVersion).where(
-            ModelVersion.model_id == m.id,
-            ModelVersion.version == version
-        )
-    )).scalar_one_or_none()
-    if not mv:
-        raise HTTPException(404, "Version not declared")
+    """List files in a version for download"""
+    return await _listings.do(("files", name, version), lambda: _version_files(name, version))
 
-    try:
-        prefix = mv.s3_prefix
-        # Update tags on the existing ModelVersion to indicate a chunked upload is in progress
-        tags = mv.tags.copy() if mv.tags else {}
-        tags.update({
-            "chunked_upload": True,
-            "filename": body.filename,
-            "content_type": body.content_type,
-            "status": "uploading"
-        })
-        mv.tags = tags
-        await db.commit()
+async def _version_files(name: str, version: int):
+    async with Session() as db:
+        m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
+        if not m:
+            raise HTTPException(404, "Model not found")
+
+        mv = (await db.execute(
+            select(ModelVersion).where(
+                ModelVersion.model_id == m.id,
+                ModelVersion.version == version
+            )
+        )).scalar_one_or_none()
+        if not mv:
+            raise HTTPException(404, "Version not found")
+
+        from botocore.exceptions import ClientError
+
+        try:
+            # One indexed query on version_files; the bucket is only listed to
+            # backfill versions uploaded before manifests existed
+            entries = await manifest.ensure(db, mv)
+        except ClientError as e:
+            raise HTTPException(500, f"Failed to list files: {str(e)}")
 
+    if not entries:
         return {
-            "s3_prefix": prefix,
-            "chunk_size": 100 * 1024 * 1024,  # 100MB recommended
-            "max_chunks": 10000
+            "version": version,
+            "s3_prefix": mv.s3_prefix,
+            "files": [],
+            "message": "No files found for this version"
         }
-    except Exception as e:
-        raise HTTPException(500, f"Failed to initiate chunked upload: {str(e)}")
 
-@router.put("/models/{name}/versions/{version}/chunks/{chunk_number}")
-async def upload_chunk(
+    files = [
+        {
+            "filename": entry.filename,
+            "size": entry.size,
+            "last_modified": entry.created_at.isoformat(),
+            "s3_key": entry.s3_key,
+            "content_type": entry.content_type,
+            "etag": entry.etag,
+            "sha256": entry.sha256,
+            "download_url": f"/api/models/{name}/versions/{version}/download/{quote(entry.filename)}"
+        }
+        for entry in entries
+    ]
+    return {
+        "version": version,
+        "s3_prefix": mv.s3_prefix,
+        "files": files,
+        "message": f"Found {len(files)} files for download"
+    }
+
+@router.get("/models/{name}/versions/{version}/manifest")
+async def version_manifest(
     name: str,
     version: int,
-    chunk_number: int,
-    chunk: UploadFile = File(...),
-    uid: int = Depends(current_user_id),
     db = Depends(get_db),
 ):
-    """Upload a file chunk to be stored temporarily and combined later"""
-    if chunk_number < 1 or chunk_number > 10000:
-        raise HTTPException(400, "Chunk number must be between 1 and 10000")
-    
+    """Recorded checksums of a version's files and their last verification result"""
     m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
     if not m:
         raise HTTPException(404, "Model not found")
@@ -181,55 +236,49 @@ async def upload_chunk(
     )).scalar_one_or_none()
     if not mv:
         raise HTTPException(404, "Version not found")
-    
-    if not mv.tags.get("chunked_upload"):
-        raise HTTPException(400, "Invalid chunked upload")
-    
-    try:
-        # Create a directory for storing chunks for this upload
-        chunks_dir = f"/tmp/vaultml_chunks/{name}_v{version}"
-        os.makedirs(chunks_dir, exist_ok=True)
-        
-        chunk_file_path = f"{chunks_dir}/chunk_{chunk_number:06d}"
-        
-        # Save chunk to temporary file
-        with open(chunk_file_path, 'wb') as chunk_file:
-            chunk_size = 8192  # 8KB chunks for streaming
-            total_size = 0
-            
-            while chunk_data := await chunk.read(chunk_size):
-                chunk_file.write(chunk_data)
-                total_size += len(chunk_data)
-        
-        # Store chunk info in the model version tags
-        # Need to reassign the entire tags dict for SQLAlchemy to detect changes
-        tags = mv.tags.copy()
-        if 'uploaded_chunks' not in tags:
-            tags['uploaded_chunks'] = {}
-        tags['uploaded_chunks'][str(chunk_number)] = {
-            'file_path': chunk_file_path,
-            'size': total_size
-        }
-        mv.tags = tags
-        await db.commit()
-        
-        return {
-            "chunk_number": chunk_number,
-            "size": total_size,
-            "message": f"Chunk {chunk_number} uploaded successfully"
+
+    entries = await manifest.ensure(db, mv)
+    return {
+        "version": version,
+        "files": [
+            {
+                "filename": entry.filename,
+                "size": entry.size,
+                "content_type": entry.content_type,
+                "etag": entry.etag,
+                "sha256": entry.sha256,
+                "verified_at": entry.verified_at.isoformat() if entry.verified_at else None,
+                "verify_status": entry.verify_status,
+            }
+            for entry in entries
+        ],
+        "total_size": sum(entry.size for entry in entries),
+        "verified": all(entry.verify_status == "ok" for entry in entries),
+    }
+
+async def presigned_files(db, mv):
+    """Presigned GET URLs for every file of a version"""
+    entries = await manifest.ensure(db, mv)
+    manifest.ensure_intact(entries)
+    urls = await asyncio.gather(*(storage.presign_get_cached(entry.s3_key) for entry in entries))
+    return [
+        {
+            "filename": entry.filename,
+            "size": entry.size,
+            "s3_key": entry.s3_key,
+            "sha256": entry.sha256,
+            "url": url,
         }
-        
-    except Exception as e:
-        raise HTTPException(500, f"Failed to upload chunk {chunk_number}: {str(e)}")
+        for entry, url in zip(entries, urls)
+    ]
 
-@router.post("/models/{name}/versions/{version}/chunked/complete")
-async def complete_chunked_upload(
+@router.get("/models/{name}/versions/{version}/presign")
+async def presign_version_files(
     name: str,
     version: int,
-    uid: int = Depends(current_user_id),
     db = Depends(get_db),
 ):
-    """Combine all uploaded chunks and upload complete file to S3"""
+    """Presigned download URLs for every file in a version, in one call"""
     m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
     if not m:
         raise HTTPException(404, "Model not found")
@@ -242,278 +291,141 @@ async def complete_chunked_upload(
     )).scalar_one_or_none()
     if not mv:
         raise HTTPException(404, "Version not found")
-    
-    if not mv.tags.get("chunked_upload"):
-        raise HTTPException(400, "Invalid chunked upload")
-    
-    filename = mv.tags.get("filename")
-    content_type = mv.tags.get("content_type", "application/octet-stream")
-    key = f"{mv.s3_prefix}/{filename}"
-    uploaded_chunks = mv.tags.get("uploaded_chunks", {})
-    
-    if not uploaded_chunks:
-        raise HTTPException(400, "No chunks uploaded yet")
-    
-    try:
-        # Sort chunks by chunk number
-        chunk_numbers = sorted([int(num) for num in uploaded_chunks.keys()])
-        
-        # Create temporary file to combine all chunks
-        with tempfile.NamedTemporaryFile(delete=False) as combined_file:
-            try:
-                total_size = 0
-                
-                # Combine all chunks into one file
-                for chunk_num in chunk_numbers:
-                    chunk_info = uploaded_chunks[str(chunk_num)]
-                    chunk_file_path = chunk_info['file_path']
-                    
-                    if not os.path.exists(chunk_file_path):
-                        raise HTTPException(500, f"Chunk {chunk_num} file not found")
-                    
-                    # Copy chunk data to combined file
-                    with open(chunk_file_path, 'rb') as chunk_file:
-                        while chunk_data := chunk_file.read(8192):
-                            combined_file.write(chunk_data)
-                            total_size += len(chunk_data)
-                
-                combined_file.flush()
-                
-                # Upload the complete file to S3
-                from app.s3 import upload_file
-                
-                with open(combined_file.name, 'rb') as complete_file:
-                    file_content = complete_file.read()
-                    s3_url = upload_file(
-                        file_content=file_content,
-                        key=key,
-                        content_type=content_type
-                    )
-                
-                # Clean up chunk files and directory
-                chunks_dir = f"/tmp/vaultml_chunks/{name}_v{version}"
-                try:
-                    # First, remove all chunk files
-                    for chunk_num in chunk_numbers:
-                        chunk_info = uploaded_chunks[str(chunk_num)]
-                        chunk_file_path = chunk_info['file_path']
-                        if os.path.exists(chunk_file_path):
-                            os.unlink(chunk_file_path)
-                    
-                    # Then remove any remaining files in the directory
-                    if os.path.exists(chunks_dir):
-                        import shutil
-                        shutil.rmtree(chunks_dir)
-                        
-                except Exception as cleanup_error:
-                    # Log cleanup error but don't fail the upload
-                    print(f"Warning: Failed to cleanup chunks directory: {cleanup_error}")
-                    # Continue with the upload completion
-                
-                # Update model version status
-                # Need to reassign the entire tags dict for SQLAlchemy to detect changes
-                tags = mv.tags.copy()
-                tags.update({
-                    "status": "completed",
-                    "s3_url": s3_url,
-                    "total_size": total_size,
-                    "total_chunks": len(chunk_numbers)
-                })
-                # Clear chunk info since we don't need it anymore
-                if 'uploaded_chunks' in tags:
-                    del tags['uploaded_chunks']
-                mv.tags = tags
-                await db.commit()
-                
-                return {
-                    "version": version,
-                    "s3_key": key,
-                    "s3_prefix": mv.s3_prefix,
-                    "s3_url": s3_url,
-                    "total_size": total_size,
-                    "total_chunks": len(chunk_numbers),
-                    "message": f"Successfully combined {len(chunk_numbers)} chunks and uploaded to S3"
-                }
-                
-            finally:
-                # Clean up combined temp file
-                if os.path.exists(combined_file.name):
-                    os.unlink(combined_file.name)
-        
-    except Exception as e:
-        raise HTTPException(500, f"Failed to complete chunked upload: {str(e)}")
 
-@router.delete("/models/{name}/versions/{version}/chunked/abort")
-async def abort_chunked_upload(
+    return {
+        "version": version,
+        "s3_prefix": mv.s3_prefix,
+        # Cached URLs are refreshed this long before they expire
+        "valid_for": settings.PRESIGN_CACHE_MARGIN,
+        "files": await presigned_files(db, mv),
+    }
+
+# Tar uploads keep member paths, so filenames may contain slashes
+@router.get("/models/{name}/versions/{version}/download/{filename:path}")
+async def download_file(
     name: str,
     version: int,
-    uid: int = Depends(current_user_id),
-    db = Depends(get_db),
+    filename: str,
+    request: Request,
 ):
-    """Abort chunked upload and clean up temporary files"""
-    m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
-    if not m:
-        raise HTTPException(404, "Model not found")
+    """Download a specific file from a version, honouring Range and conditional headers"""
+    key, head = await _downloads.do(
+        (name, version, filename), lambda: _object_metadata(name, version, filename)
+    )
+    if head is None:
+        return RedirectResponse(await storage.presign_get_cached(key), status_code=307)
+    return await _object_response(request, key, filename, head)
 
-    mv = (await db.execute(
-        select(ModelVersion).where(
-            ModelVersion.model_id == m.id,
-            ModelVersion.version == version
-        )
-    )).scalar_one_or_none()
-    if not mv:
-        raise HTTPException(404, "Version not found")
-    
-    if not mv.tags.get("chunked_upload"):
-        raise HTTPException(400, "Invalid chunked upload")
-    
-    try:
-        # Clean up any uploaded chunks
-        uploaded_chunks = mv.tags.get("uploaded_chunks", {})
-        chunks_dir = f"/tmp/vaultml_chunks/{name}_v{version}"
-        
-        try:
-            # Remove individual chunk files first
-            for chunk_num, chunk_info in uploaded_chunks.items():
-                chunk_file_path = chunk_info['file_path']
-                if os.path.exists(chunk_file_path):
-                    os.unlink(chunk_file_path)
-            
-            # Remove entire directory and any remaining files
-            if os.path.exists(chunks_dir):
-                import shutil
-                shutil.rmtree(chunks_dir)
-                
-        except Exception as cleanup_error:
-            # Log cleanup error but don't fail the abort
-            print(f"Warning: Failed to cleanup chunks during abort: {cleanup_error}")
-        
-        # Delete the model version record
-        await db.delete(mv)
-        await db.commit()
-        
-        return {"message": "Chunked upload aborted successfully"}
-    except Exception as e:
-        raise HTTPException(500, f"Failed to abort chunked upload: {str(e)}")
 
-@router.get("/multipart/uploads")
-async def list_ongoing_uploads(uid: int = Depends(current_user_id)):
-    """List ongoing multipart uploads"""
-    try:
-        uploads = list_multipart_uploads()
-        return uploads
-    except Exception as e:
-        raise HTTPException(500, f"Failed to list uploads: {str(e)}")
-    
+async def _object_metadata(name: str, version: int, filename: str):
+    """Object key of a version's file, and its HEAD metadata unless downloads redirect"""
+    async with Session() as db:
+        m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
+        if not m:
+            raise HTTPException(404, "Model not found")
 
-@router.get("/models/{name}/versions/{version}/download")
-async def list_version_files(
-    name: str,
-    version: int,
-    db = Depends(get_db),
-):
-    """List files in a version for download"""
-    m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
-    if not m:
-        raise HTTPException(404, "Model not found")
+        mv = (await db.execute(
+            select(ModelVersion).where(
+                ModelVersion.model_id == m.id,
+                ModelVersion.version == version
+            )
+        )).scalar_one_or_none()
+        if not mv:
+            raise HTTPException(404, "Version not found")
 
-    mv = (await db.execute(
-        select(ModelVersion).where(
-            ModelVersion.model_id == m.id,
-            ModelVersion.version == version
-        )
-    )).scalar_one_or_none()
-    if not mv:
-        raise HTTPException(404, "Version not found")
+        key = await manifest.resolve_object_key(db, mv, filename)
+
+    if settings.DOWNLOAD_MODE == "redirect":
+        return key, None
 
-    
     from botocore.exceptions import ClientError
-    from app.s3 import s3_client
-    s3 = s3_client()
-    
+
     try:
-        response = s3.list_objects_v2(
-            Bucket=settings.S3_BUCKET,
-            Prefix=f"{mv.s3_prefix}/"
-        )
-        
-        if 'Contents' not in response:
-            return {
-                "version": version,
-                "s3_prefix": mv.s3_prefix,
-                "files": [],
-                "message": "No files found for this version"
-            }
-        
-        files = []
-        for obj in response['Contents']:
-            key = obj['Key']
-            filename = key.split('/')[-1]  
-            if filename:  
-                files.append({
-                    "filename": filename,
-                    "size": obj['Size'],
-                    "last_modified": obj['LastModified'].isoformat(),
-                    "s3_key": key,
-                    "download_url": f"/api/models/{name}/versions/{version}/download/{filename}"
-                })
-        
-        return {
-            "version": version,
-            "s3_prefix": mv.s3_prefix,
-            "files": files,
-            "message": f"Found {len(files)} files for download"
-        }
-        
+        return key, await storage.head_object(key)
     except ClientError as e:
-        raise HTTPException(500, f"Failed to list files: {str(e)}")
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            raise HTTPException(404, f"File {filename} not found")
+        raise HTTPException(500, f"Failed to download file: {str(e)}")
 
-@router.get("/models/{name}/versions/{version}/download/{filename}")
-async def download_file(
-    name: str,
-    version: int,
-    filename: str,
-    db = Depends(get_db),
-):
-    """Download a specific file from a version"""
-    from fastapi.responses import StreamingResponse
-    import io
-    
-    m = (await db.execute(select(Model).where(Model.name == name))).scalar_one_or_none()
-    if not m:
-        raise HTTPException(404, "Model not found")
 
-    mv = (await db.execute(
-        select(ModelVersion).where(
-            ModelVersion.model_id == m.id,
-            ModelVersion.version == version
+def _attachment(filename: str) -> str:
+    """Content-Disposition naming the file's last path component, safe for any characters"""
+    name = posixpath.basename(filename)
+    fallback = name.encode("ascii", "replace").decode().replace('"', "_").replace("\\", "_")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(name, safe='')}"
+
+
+async def _object_response(request: Request, key: str, filename: str, head: dict):
+    """Build a full, ranged or 304 response for an object from its HEAD metadata"""
+    etag = head["ETag"]
+    last_modified = head["LastModified"]
+    size = head["ContentLength"]
+    content_type = head.get("ContentType", "application/octet-stream")
+    headers = {
+        "Content-Disposition": _attachment(filename),
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": ranges.http_date(last_modified),
+    }
+
+    if ranges.is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    requested = None
+    if ranges.if_range_matches(request.headers, etag, last_modified):
+        try:
+            requested = ranges.parse_range(request.headers.get("range"), size)
+        except ranges.RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    # Every GET carries IfMatch so the object can't change between HEAD and GET
+    cached = disk_cache.enabled(size)
+    if cached and "range" not in request.headers:
+        # Only without Range: CachedFileResponse would apply one itself, even if If-Range rejected it
+        path = await disk_cache.lookup(key, etag)
+        if path:
+            return disk_cache.CachedFileResponse(path, media_type=content_type, headers=headers)
+
+    def read(start, end):
+        if cached:
+            return disk_cache.stream(key, etag, size, start, end)
+        return proxy.stream_object(key, start, end, etag)
+
+    if requested is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            read(0, size - 1),
+            media_type=content_type,
+            headers=headers
         )
-    )).scalar_one_or_none()
-    if not mv:
-        raise HTTPException(404, "Version not found")
 
-    
-    from botocore.exceptions import ClientError
-    from app.s3 import s3_client
-    s3 = s3_client()
-    
-    try:
-        key = f"{mv.s3_prefix}/{filename}"
-        response = s3.get_object(Bucket=settings.S3_BUCKET, Key=key)
-        
-        
-        def generate():
-            for chunk in response['Body'].iter_chunks(chunk_size=8192):
-                yield chunk
-        
+    if len(requested) == 1:
+        start, end = requested[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
         return StreamingResponse(
-            generate(),
-            media_type=response.get('ContentType', 'application/octet-stream'),
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            read(start, end),
+            status_code=206,
+            media_type=content_type,
+            headers=headers
         )
-        
-    except ClientError as e:
-        if e.response['Error']['Code'] == 'NoSuchKey':
-            raise HTTPException(404, f"File {filename} not found")
-        raise HTTPException(500, f"Failed to download file: {str(e)}")
-    
+
+    boundary = uuid.uuid4().hex
+    part_headers, trailer, length = ranges.byteranges_layout(requested, size, content_type, boundary)
+
+    async def generate():
+        for part_header, (start, end) in zip(part_headers, requested):
+            yield part_header
+            async for chunk in read(start, end):
+                yield chunk
+            yield b"\r\n"
+        yield trailer
+
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(
+        generate(),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers
+    )
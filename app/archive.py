@@ -0,0 +1,221 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Streaming tar and zip64 archives of a version's files.
+
+Archives are assembled on the fly from the version manifest: headers are
+built in memory, member bodies are streamed from storage through the
+download proxy, and the next member is opened while the current one is
+sent. Nothing touches local disk and memory stays bounded by the proxy
+buffers, whatever the archive size.
+
+Both formats are uncompressed, so the total length is known from the
+manifest before the first byte is sent. Zip members use data descriptors
+because their CRC-32 is only known once the body has streamed through.
+"""
+
+import asyncio
+import contextlib
+import struct
+import tarfile
+import time
+import zlib
+
+from app import proxy
+
+TAR_RECORD = tarfile.RECORDSIZE
+_BLOCK = tarfile.BLOCKSIZE
+
+_ZIP_VERSION = 45  # zip64
+_ZIP_FLAGS = 0x0808  # data descriptor, UTF-8 names
+_ZIP64_MAX = 0xFFFFFFFF
+
+
+class _Member:
+    """One file of the archive, with its body prefetched as soon as it is opened"""
+
+    def __init__(self, entry):
+        self.name = entry.filename
+        self.size = entry.size
+        self.mtime = entry.created_at.timestamp() if entry.created_at else time.time()
+        self._entry = entry
+        self._body = None
+        self._first = None
+
+    def open(self):
+        if self._body is None:
+            self._body = proxy.stream_object(self._entry.s3_key, 0, self.size - 1, self._entry.etag)
+            self._first = asyncio.ensure_future(anext(self._body, None))
+
+    async def chunks(self):
+        self.open()
+        sent = 0
+        chunk = await self._first
+        while chunk is not None:
+            sent += len(chunk)
+            yield chunk
+            chunk = await anext(self._body, None)
+        if sent != self.size:
+            # The header already promised self.size bytes; abort rather than corrupt
+            raise IOError(f"{self.name}: expected {self.size} bytes, storage sent {sent}")
+
+    async def close(self):
+        if self._first is not None:
+            self._first.cancel()
+            # aclose() raises RuntimeError while the prefetch is still inside the
+            # generator; wait for it to unwind, without re-raising its outcome
+            await asyncio.wait([self._first])
+            if not self._first.cancelled():
+                self._first.exception()
+            self._first = None
+        if self._body is not None:
+            await self._body.aclose()
+            self._body = None
+
+
+async def _members(entries):
+    """Yield members in order, opening each one's successor before handing it out"""
+    members = [_Member(entry) for entry in entries]
+    try:
+        for index, member in enumerate(members):
+            member.open()
+            if index + 1 < len(members):
+                members[index + 1].open()
+            yield member
+            await member.close()
+    finally:
+        for member in members:
+            await member.close()
+
+
+def _tar_header(member):
+    info = tarfile.TarInfo(member.name)
+    info.size = member.size
+    info.mtime = int(member.mtime)
+    info.mode = 0o644
+    # PAX headers carry sizes above 8 GiB and non-ASCII names
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+
+
+def _tar_padding(size):
+    return (_BLOCK - size % _BLOCK) % _BLOCK
+
+
+def tar_length(entries) -> int:
+    length = sum(
+        len(_tar_header(_Member(entry))) + entry.size + _tar_padding(entry.size)
+        for entry in entries
+    )
+    length += 2 * _BLOCK
+    return length + (TAR_RECORD - length % TAR_RECORD) % TAR_RECORD
+
+
+async def stream_tar(entries):
+    length = 0
+    # Closed explicitly so a client disconnect releases the prefetched bodies at once
+    async with contextlib.aclosing(_members(entries)) as members:
+        async for member in members:
+            header = _tar_header(member)
+            length += len(header)
+            yield header
+            async for chunk in member.chunks():
+                yield chunk
+            padding = _tar_padding(member.size)
+            length += member.size + padding
+            if padding:
+                yield b"\0" * padding
+    end = 2 * _BLOCK
+    length += end
+    yield b"\0" * (end + (TAR_RECORD - length % TAR_RECORD) % TAR_RECORD)
+
+
+def _dos_time(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (
+        (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday,
+    )
+
+
+def _zip_local_header(name, size, mtime):
+    dos_time, dos_date = _dos_time(mtime)
+    extra = struct.pack("<HHQQ", 0x0001, 16, size, size)
+    return struct.pack(
+        "<IHHHHHIIIHH", 0x04034B50, _ZIP_VERSION, _ZIP_FLAGS, 0, dos_time, dos_date,
+        0, _ZIP64_MAX, _ZIP64_MAX, len(name), len(extra),
+    ) + name + extra
+
+
+def _zip_descriptor(crc, size):
+    return struct.pack("<IIQQ", 0x08074B50, crc, size, size)
+
+
+def _zip_central_header(name, size, mtime, crc, offset):
+    dos_time, dos_date = _dos_time(mtime)
+    extra = struct.pack("<HHQQQ", 0x0001, 24, size, size, offset)
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | _ZIP_VERSION, _ZIP_VERSION, _ZIP_FLAGS,
+        0, dos_time, dos_date, crc, _ZIP64_MAX, _ZIP64_MAX, len(name), len(extra), 0, 0, 0,
+        0o100644 << 16, _ZIP64_MAX,
+    ) + name + extra
+
+
+def _zip_end(count, directory_offset, directory_size):
+    end_offset = directory_offset + directory_size
+    return (
+        struct.pack(
+            "<IQHHIIQQQQ", 0x06064B50, 44, _ZIP_VERSION, _ZIP_VERSION, 0, 0,
+            count, count, directory_size, directory_offset,
+        )
+        + struct.pack("<IIQI", 0x07064B50, 0, end_offset, 1)
+        + struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(directory_size, _ZIP64_MAX), _ZIP64_MAX, 0,
+        )
+    )
+
+
+def zip_length(entries) -> int:
+    length = 0
+    for entry in entries:
+        name = len(entry.filename.encode("utf-8"))
+        # local header + body + descriptor + central directory entry
+        length += (30 + name + 20) + entry.size + 24 + (46 + name + 28)
+    return length + 56 + 20 + 22
+
+
+async def stream_zip(entries):
+    offset = 0
+    directory = []
+    async with contextlib.aclosing(_members(entries)) as members:
+        async for member in members:
+            name = member.name.encode("utf-8")
+            header = _zip_local_header(name, member.size, member.mtime)
+            yield header
+            crc = 0
+            async for chunk in member.chunks():
+                crc = zlib.crc32(chunk, crc)
+                yield chunk
+            yield _zip_descriptor(crc, member.size)
+            directory.append(_zip_central_header(name, member.size, member.mtime, crc, offset))
+            offset += len(header) + member.size + 24
+
+    directory_size = sum(len(record) for record in directory)
+    for record in directory:
+        yield record
+    yield _zip_end(len(directory), offset, directory_size)
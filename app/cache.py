@@ -0,0 +1,109 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Small in-process LRU cache with per-entry expiry"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from app.main import settings
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after a TTL.
+
+    Thread-safe so it can be shared between the event loop and the storage
+    pool. Counts hits, misses and evictions for /api/metrics.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped by invalidate() so values computed before a write are not stored
+        self.generation = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                self.evictions += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None, generation: int = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate=None):
+        """Drop every entry, or those whose key matches the predicate"""
+        with self._lock:
+            self.generation += 1
+            if predicate is None:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Resolved payloads keyed by ("name", name, alias, version) or
+# ("group", group_name, variant, alias, version). Writes invalidate locally;
+# other workers see changes once RESOLVE_CACHE_TTL elapses.
+resolve_cache = TTLCache(settings.RESOLVE_CACHE_SIZE, settings.RESOLVE_CACHE_TTL)
+
+# Dashboard statistics, recomputed at most once per DASHBOARD_CACHE_TTL
+dashboard_cache = TTLCache(1, settings.DASHBOARD_CACHE_TTL)
+
+
+def invalidate_models(*models):
+    """Drop cached resolutions and dashboard stats after a write to these models"""
+    names = {m.name for m in models}
+    group_variants = {(m.group_name, m.variant) for m in models}
+    resolve_cache.invalidate(
+        lambda key: (key[0] == "name" and key[1] in names)
+        or (key[0] == "group" and (key[1], key[2]) in group_variants)
+    )
+    dashboard_cache.invalidate()
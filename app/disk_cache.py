@@ -0,0 +1,327 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Node-local read-through disk cache for proxied downloads.
+
+Objects are cached as whole files named after a hash of their key and
+ETag, so a new upload under the same key is a different entry and stale
+bytes are never served. The cache is capped at DISK_CACHE_MAX_BYTES and
+evicts least recently used files.
+
+A miss starts one background fill per entry that streams the object from
+storage into a partial file. Every request for that entry, including the
+first, tails the growing file as bytes land, so a rollout that asks for the
+same weights hundreds of times costs a single storage read. The fill is not
+tied to any request and completes even if its first client disconnects.
+A Range request starting past what the fill has written so far is served
+straight from storage instead of waiting for the fill to reach it, and any
+cache failure (unwritable directory, full disk, a failed fill) falls back
+to storage for the rest of the response.
+
+Complete entries are served from the file by CachedFileResponse. Under
+uvicorn this is not zero-copy: it has no http.response.pathsend, so the
+file is still read in a worker thread, in 1 MiB chunks to keep the thread
+hops few. Servers that implement pathsend send the file directly.
+
+The index lives in process memory and is rebuilt from the directory once
+per process; partial files left by a crash are removed then.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from fastapi.responses import FileResponse
+
+from app import proxy
+from app.main import settings
+
+_READ_SIZE = 1024 * 1024
+
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_index = OrderedDict()  # entry name -> size, least recently used first
+_fills = {}
+_loaded = False
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "fills": 0,
+    "fill_errors": 0,
+    "evictions": 0,
+    "fallbacks": 0,
+    "bytes": 0,
+}
+
+
+class CachedFileResponse(FileResponse):
+    chunk_size = _READ_SIZE
+
+
+def enabled(size: int) -> bool:
+    return settings.DISK_CACHE_ENABLED and 0 < size <= settings.DISK_CACHE_MAX_OBJECT_SIZE
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["entries"] = len(_index)
+    snapshot["max_bytes"] = settings.DISK_CACHE_MAX_BYTES
+    snapshot["filling"] = len(_fills)
+    return snapshot
+
+
+def _name(key: str, etag: str) -> str:
+    return hashlib.sha256(f"{key}\0{etag}".encode()).hexdigest()
+
+
+def _path(name: str) -> str:
+    return os.path.join(settings.DISK_CACHE_DIR, name[:2], name)
+
+
+def _load():
+    global _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if _loaded:
+            return
+        found = []
+        os.makedirs(settings.DISK_CACHE_DIR, exist_ok=True)
+        for parent, _, files in os.walk(settings.DISK_CACHE_DIR):
+            for filename in files:
+                path = os.path.join(parent, filename)
+                # Files may vanish under another worker's eviction or fill
+                try:
+                    if ".partial-" in filename:
+                        os.unlink(path)
+                        continue
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((st.st_atime, filename, st.st_size))
+        with _lock:
+            for _, filename, size in sorted(found):
+                _index[filename] = size
+                _stats["bytes"] += size
+            _loaded = True
+
+
+def _evict():
+    """Drop least recently used entries until the cache fits its cap"""
+    victims = []
+    with _lock:
+        while _stats["bytes"] > settings.DISK_CACHE_MAX_BYTES and _index:
+            name, size = _index.popitem(last=False)
+            _stats["bytes"] -= size
+            _stats["evictions"] += 1
+            victims.append(name)
+    for name in victims:
+        try:
+            os.unlink(_path(name))
+        except FileNotFoundError:
+            pass
+
+
+def _admit(name: str, size: int):
+    with _lock:
+        if name not in _index:
+            _index[name] = size
+            _stats["bytes"] += size
+    _evict()
+
+
+def _lookup(name: str):
+    with _lock:
+        if name not in _index:
+            return None
+        _index.move_to_end(name)
+    path = _path(name)
+    if os.path.exists(path):
+        return path
+    # Removed behind our back (another worker's eviction, manual cleanup)
+    with _lock:
+        size = _index.pop(name, None)
+        if size is not None:
+            _stats["bytes"] -= size
+    return None
+
+
+async def lookup(key: str, etag: str):
+    """Path of a complete cached copy, or None"""
+    try:
+        await asyncio.to_thread(_load)
+        path = await asyncio.to_thread(_lookup, _name(key, etag))
+    except OSError as e:
+        print(f"Warning: Disk cache unavailable: {e}")
+        return None
+    if path:
+        with _lock:
+            _stats["hits"] += 1
+    return path
+
+
+class _Fill:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.partial = f"{_path(name)}.partial-{uuid.uuid4().hex}"
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.progress = asyncio.Condition()
+        # Set once the partial file exists (or the fill has failed)
+        self.opened = asyncio.Event()
+        self.task = None
+
+    async def _advance(self, written=None, error=None, done=False):
+        async with self.progress:
+            if written is not None:
+                self.written = written
+            self.error = error or self.error
+            self.done = done or self.done
+            self.progress.notify_all()
+
+
+async def _run_fill(fill: _Fill, key: str, etag: str):
+    fd = None
+    try:
+        await asyncio.to_thread(os.makedirs, os.path.dirname(fill.partial), exist_ok=True)
+        fd = await asyncio.to_thread(os.open, fill.partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        fill.opened.set()
+        written = 0
+        async for chunk in proxy.stream_object(key, 0, fill.size - 1, etag):
+            await asyncio.to_thread(os.write, fd, chunk)
+            written += len(chunk)
+            await fill._advance(written=written)
+        if written != fill.size:
+            raise IOError(f"{key}: expected {fill.size} bytes, storage sent {written}")
+        await asyncio.to_thread(os.close, fd)
+        fd = None
+        await asyncio.to_thread(os.replace, fill.partial, _path(fill.name))
+        await asyncio.to_thread(_admit, fill.name, fill.size)
+        await fill._advance(done=True)
+    except BaseException as e:
+        with _lock:
+            _stats["fill_errors"] += 1
+        await fill._advance(error=e if isinstance(e, Exception) else IOError("cache fill cancelled"), done=True)
+        if fd is not None:
+            os.close(fd)
+        try:
+            os.unlink(fill.partial)
+        except FileNotFoundError:
+            pass
+        if not isinstance(e, Exception):
+            raise
+    finally:
+        fill.opened.set()
+        _fills.pop(fill.name, None)
+
+
+def _join(key: str, etag: str, size: int) -> _Fill:
+    """The in-flight fill of an entry, starting one if none is running"""
+    name = _name(key, etag)
+    fill = _fills.get(name)
+    with _lock:
+        if fill is not None:
+            _stats["coalesced"] += 1
+        else:
+            _stats["misses"] += 1
+            _stats["fills"] += 1
+    if fill is None:
+        fill = _fills[name] = _Fill(name, size)
+        fill.task = asyncio.create_task(_run_fill(fill, key, etag))
+    return fill
+
+
+def _open(paths):
+    for path in paths:
+        try:
+            return os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+    return None
+
+
+async def _read_file(fd: int, start: int, end: int):
+    pos = start
+    while pos <= end:
+        chunk = await asyncio.to_thread(os.pread, fd, min(_READ_SIZE, end + 1 - pos), pos)
+        if not chunk:
+            raise IOError("cached file is shorter than expected")
+        pos += len(chunk)
+        yield chunk
+
+
+async def _cached(key: str, etag: str, size: int, start: int, end: int):
+    """Bytes start..end from the cache; stops early where storage should take over"""
+    await asyncio.to_thread(_load)
+    name = _name(key, etag)
+    path = await asyncio.to_thread(_lookup, name)
+    if path:
+        with _lock:
+            _stats["hits"] += 1
+    fill = None if path else _join(key, etag, size)
+
+    # The fill may finish and rename its partial file before we open it
+    if fill is not None:
+        await fill.opened.wait()
+        if fill.error:
+            raise fill.error
+        if not fill.done and start > fill.written:
+            # Far ahead of the fill: fetch the range now rather than wait for it
+            return
+    paths = [path] if path else [fill.partial, _path(name)]
+    fd = await asyncio.to_thread(_open, paths)
+    if fd is None:
+        return
+
+    try:
+        pos = start
+        while pos <= end:
+            if fill is not None and not fill.done:
+                async with fill.progress:
+                    await fill.progress.wait_for(lambda: fill.written > pos or fill.done)
+            if fill is not None and fill.error:
+                raise fill.error
+            available = fill.written if fill is not None and not fill.done else size
+            async for chunk in _read_file(fd, pos, min(available, end + 1) - 1):
+                pos += len(chunk)
+                yield chunk
+    finally:
+        os.close(fd)
+
+
+async def stream(key: str, etag: str, size: int, start: int, end: int):
+    """Yield bytes start..end of an object through the cache, or from storage where it can't help"""
+    pos = start
+    try:
+        async with contextlib.aclosing(_cached(key, etag, size, start, end)) as chunks:
+            async for chunk in chunks:
+                pos += len(chunk)
+                yield chunk
+    except Exception as e:
+        print(f"Warning: Disk cache failed for {key}, reading from storage: {e}")
+    if pos <= end:
+        with _lock:
+            _stats["fallbacks"] += 1
+        async for chunk in proxy.stream_object(key, pos, end, etag):
+            yield chunk
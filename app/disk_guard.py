@@ -0,0 +1,95 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Disk high-water marks for upload requests.
+
+Form uploads are spooled to local disk before a handler runs, so a full
+volume fails every upload at once. Upload requests are checked before their
+body is read: above UPLOAD_DISK_SOFT_LIMIT they get 429 with Retry-After,
+above UPLOAD_DISK_HARD_LIMIT 507.
+"""
+
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from fastapi.responses import JSONResponse
+
+from app.main import settings
+
+# Endpoints whose request bodies land on local disk
+_UPLOAD_PATHS = re.compile(r"^/api/models/[^/]+/versions/(new|\d+/chunks/\d+)$")
+
+# statvfs is cheap, but a burst of chunk PUTs needs only one reading per interval
+_SAMPLE_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_sample = {"at": 0.0, "used": 0.0}
+_stats = {"rejected_soft": 0, "rejected_hard": 0}
+
+
+def _path():
+    return settings.UPLOAD_DISK_PATH or tempfile.gettempdir()
+
+
+def usage() -> float:
+    """Fraction of the upload volume in use"""
+    now = time.monotonic()
+    with _lock:
+        if now - _sample["at"] < _SAMPLE_INTERVAL:
+            return _sample["used"]
+    total, used, _ = shutil.disk_usage(_path())
+    fraction = used / total if total else 0.0
+    with _lock:
+        _sample.update(at=now, used=fraction)
+    return fraction
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+    snapshot.update(
+        path=_path(),
+        used=usage(),
+        soft_limit=settings.UPLOAD_DISK_SOFT_LIMIT,
+        hard_limit=settings.UPLOAD_DISK_HARD_LIMIT,
+    )
+    return snapshot
+
+
+def check(method: str, path: str):
+    """Rejection response for an upload request while the disk is too full, else None"""
+    if method not in ("POST", "PUT") or not _UPLOAD_PATHS.match(path):
+        return None
+    used = usage()
+    if used >= settings.UPLOAD_DISK_HARD_LIMIT:
+        with _lock:
+            _stats["rejected_hard"] += 1
+        return JSONResponse(
+            {"detail": f"Insufficient storage: upload volume is {used:.0%} full"},
+            status_code=507,
+        )
+    if used >= settings.UPLOAD_DISK_SOFT_LIMIT:
+        with _lock:
+            _stats["rejected_soft"] += 1
+        return JSONResponse(
+            {"detail": f"Upload volume is {used:.0%} full, retry later"},
+            status_code=429,
+            headers={"Retry-After": str(settings.UPLOAD_DISK_RETRY_AFTER)},
+        )
+    return None
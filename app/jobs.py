@@ -0,0 +1,110 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Scaffolding shared by the periodic background jobs.
+
+A Job runs its pass every few seconds set by a setting, on every worker
+whose enabling setting is on. Each pass holds a Postgres advisory lock, so
+only one worker runs a given job at a time; a worker that finds the lock
+taken skips the pass. Counters live in Job.stats for /api/metrics.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+
+from app.main import engine, settings
+
+
+class Job:
+    def __init__(self, name: str, lock_key: int, enabled: str, interval: str, **counters):
+        """enabled and interval name the settings that switch the loop on and
+        space its passes; counters are the job's own stats, starting values"""
+        self.name = name
+        self._lock_key = lock_key
+        self._run = None
+        self._enabled = enabled
+        self._interval = interval
+        self._task = None
+        self._manual_task = None
+        self.stats = {
+            "running": False,
+            "runs": 0,
+            "last_started": None,
+            "last_finished": None,
+            "last_error": None,
+            **counters,
+        }
+
+    def each_pass(self, fn):
+        """Decorator registering the coroutine function that does one pass"""
+        self._run = fn
+        return fn
+
+    def snapshot(self):
+        return dict(self.stats)
+
+    async def run_once(self, *args):
+        """Run one pass; returns False if another worker holds the lock"""
+        async with engine.connect() as conn:
+            if not await conn.scalar(select(func.pg_try_advisory_lock(self._lock_key))):
+                return False
+            try:
+                self.stats.update(
+                    running=True,
+                    last_started=datetime.now(timezone.utc).isoformat(),
+                    last_error=None,
+                )
+                await self._run(*args)
+                self.stats["runs"] += 1
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                raise
+            finally:
+                self.stats.update(running=False, last_finished=datetime.now(timezone.utc).isoformat())
+                await conn.scalar(select(func.pg_advisory_unlock(self._lock_key)))
+        return True
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: {self.name} pass failed: {e}")
+            await asyncio.sleep(getattr(settings, self._interval))
+
+    def trigger(self, *args) -> bool:
+        """Start a pass in the background unless one is already running here"""
+        if self.stats["running"] or (self._manual_task is not None and not self._manual_task.done()):
+            return False
+        self._manual_task = asyncio.create_task(self.run_once(*args))
+        return True
+
+    def start(self):
+        if getattr(settings, self._enabled) and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
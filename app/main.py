@@ -23,6 +23,7 @@ from sqlalchemy.ext.asyncio import (
     AsyncSession, create_async_engine, async_sessionmaker
 )
 from sqlalchemy.orm import mapped_column, Mapped, DeclarativeBase
+from sqlalchemy.schema import CreateIndex
 from typing import Dict
 import time, jwt
 from fastapi import HTTPException
@@ -39,6 +40,101 @@ class Settings(BaseSettings):
     S3_SECRET_KEY: str
     DOMAIN_NAME: str
 
+    # Shared S3 client tuning
+    S3_MAX_POOL_CONNECTIONS: int = 50
+    S3_CONNECT_TIMEOUT: float = 5.0
+    S3_READ_TIMEOUT: float = 60.0
+    S3_MAX_ATTEMPTS: int = 5
+    S3_RETRY_MODE: str = "adaptive"
+    S3_TCP_KEEPALIVE: bool = True
+
+    # Dedicated thread pool that runs blocking S3 calls off the event loop
+    S3_IO_THREADS: int = 32
+    S3_IO_QUEUE_LIMIT: int = 256
+
+    # Streaming uploads: multipart transfer above the threshold, with bounded
+    # part size and per-file concurrency; UPLOAD_CONCURRENCY files at once
+    S3_MULTIPART_THRESHOLD: int = 64 * 1024 * 1024
+    S3_MULTIPART_CHUNKSIZE: int = 16 * 1024 * 1024
+    S3_TRANSFER_CONCURRENCY: int = 4
+    UPLOAD_CONCURRENCY: int = 4
+    # Tar uploads: members up to this size are buffered and uploaded
+    # UPLOAD_CONCURRENCY at a time, larger ones are streamed one by one
+    TAR_SMALL_MEMBER_SIZE: int = 8 * 1024 * 1024
+
+    # Lifetime of presigned URLs handed to clients, in seconds
+    S3_PRESIGN_EXPIRES: int = 3600
+    # Endpoint clients use to reach storage, if it differs from S3_ENDPOINT
+    S3_PUBLIC_ENDPOINT: str = ""
+    PRESIGN_CACHE_SIZE: int = 10000
+    PRESIGN_CACHE_MARGIN: int = 300
+
+    # "proxy" streams downloads through the API, "redirect" answers with a
+    # 307 to a presigned storage URL
+    DOWNLOAD_MODE: str = "proxy"
+
+    # Download proxy: buffer size, read-ahead depth, and parallel ranged GETs
+    # (PROXY_PARALLEL_FETCHES segments in flight) for ranges above the threshold
+    PROXY_BUFFER_SIZE: int = 1024 * 1024
+    PROXY_READ_AHEAD: int = 8
+    PROXY_PARALLEL_THRESHOLD: int = 64 * 1024 * 1024
+    PROXY_PARALLEL_FETCHES: int = 4
+    PROXY_SEGMENT_SIZE: int = 8 * 1024 * 1024
+
+    # Node-local read-through cache for proxied downloads, keyed by object
+    # key and ETag, LRU-evicted above DISK_CACHE_MAX_BYTES
+    DISK_CACHE_ENABLED: bool = False
+    DISK_CACHE_DIR: str = "/var/cache/vaultml"
+    DISK_CACHE_MAX_BYTES: int = 50 * 1024 ** 3
+    DISK_CACHE_MAX_OBJECT_SIZE: int = 16 * 1024 ** 3
+
+    # In-process cache of resolved model references
+    RESOLVE_CACHE_SIZE: int = 10000
+    RESOLVE_CACHE_TTL: float = 10.0
+    DASHBOARD_CACHE_TTL: float = 30.0
+
+    # Background reclamation of orphaned objects and stale multipart uploads
+    REAPER_ENABLED: bool = False
+    REAPER_DRY_RUN: bool = False
+    REAPER_INTERVAL: int = 3600
+    REAPER_GRACE_PERIOD: int = 24 * 3600
+    REAPER_MULTIPART_MAX_AGE: int = 2 * 24 * 3600
+    REAPER_DELETE_BATCH: int = 1000
+    REAPER_BATCHES_PER_SECOND: float = 2.0
+
+    # Upload sessions expire UPLOAD_SESSION_TTL seconds after their last
+    # activity; the sweeper aborts expired ones every UPLOAD_SWEEP_INTERVAL
+    UPLOAD_SESSION_TTL: int = 24 * 3600
+    UPLOAD_SWEEP_ENABLED: bool = True
+    UPLOAD_SWEEP_INTERVAL: int = 600
+    # Delete expired versions that have nothing stored instead of marking them
+    UPLOAD_SWEEP_REMOVE_VERSIONS: bool = False
+    # Local chunk staging directory of older releases, purged by the sweeper
+    UPLOAD_LEGACY_STAGING_DIR: str = "/tmp/vaultml_chunks"
+
+    # Disk high-water marks for the volume request bodies are spooled to
+    # (system temp dir if unset): new uploads get 429 above the soft mark
+    # and 507 above the hard mark
+    UPLOAD_DISK_PATH: str = ""
+    UPLOAD_DISK_SOFT_LIMIT: float = 0.85
+    UPLOAD_DISK_HARD_LIMIT: float = 0.95
+    UPLOAD_DISK_RETRY_AFTER: int = 30
+
+    # Store uploaded files once under their SHA-256 digest and let versions
+    # reference them through the version_files manifest
+    CONTENT_ADDRESSED_STORAGE: bool = False
+    BLOB_PREFIX: str = "blobs/sha256"
+    # Multipart uploads complete under a staging key; a background pass
+    # hashes them and moves them to their blob every BLOB_PROMOTE_INTERVAL
+    BLOB_PROMOTE_INTERVAL: int = 300
+    BLOB_PROMOTE_BATCH: int = 100
+
+    # Background re-hashing of stored files against their manifest entries
+    VERIFY_ENABLED: bool = False
+    VERIFY_INTERVAL: int = 3600
+    VERIFY_REVERIFY_AFTER: int = 7 * 24 * 3600
+    VERIFY_BATCH: int = 100
+
 settings = Settings()
 
 
@@ -49,6 +145,11 @@ Session = async_sessionmaker(engine, expire_on_commit=False)
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips tables that already exist, so indexes declared on
+        # them since are added here
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.execute(CreateIndex(index, if_not_exists=True))
 
 
 def make_jwt(user_id: int):
@@ -0,0 +1,167 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Per-version file manifests and the content-addressed blob layout.
+
+With CONTENT_ADDRESSED_STORAGE enabled, file bodies are stored once under
+"{BLOB_PREFIX}/{sha256}" and each version lists its files in version_files,
+mapping filename to digest and object key. A file whose digest is already
+stored is linked instead of uploaded again, so an incremental version costs
+only the bytes that changed. Multipart uploads complete under a staging
+key in the version prefix and are moved to their blob by app.promoter once
+the server has hashed them. Versions without manifest rows keep the plain
+"{s3_prefix}/{filename}" layout.
+
+Every upload path records its files here with size, content type, storage
+ETag and SHA-256, so listings and integrity checks never list the bucket.
+Versions uploaded before manifests existed are backfilled from one listing
+the first time they are read; their digests are filled in by the verifier.
+"""
+
+import re
+import uuid
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app import storage
+from app.main import settings
+from app.model.version_file import VersionFile
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def valid_digest(digest: str) -> bool:
+    return bool(digest and _DIGEST.match(digest))
+
+
+def blob_key(digest: str) -> str:
+    return f"{settings.BLOB_PREFIX}/{digest}"
+
+
+def staging_key(mv, filename: str) -> str:
+    """Unique key a multipart upload completes under before promotion to its blob"""
+    return f"{mv.s3_prefix}/.staging/{uuid.uuid4().hex}/{filename}"
+
+
+def is_blob_key(key: str) -> bool:
+    return key.startswith(f"{settings.BLOB_PREFIX}/")
+
+
+async def stored_blobs(db, digests):
+    """Manifest row of one stored copy for each known digest.
+
+    Only digests the server computed itself count: a client-declared digest
+    is a claim about bytes nobody has hashed yet, and linking other versions
+    to it would let one upload stand in for another model's file.
+    """
+    if not digests:
+        return {}
+    rows = (await db.execute(
+        select(VersionFile)
+        .where(
+            VersionFile.sha256.in_(list(digests)),
+            VersionFile.s3_key.startswith(f"{settings.BLOB_PREFIX}/"),
+            VersionFile.sha256_verified.is_(True),
+            func.coalesce(VersionFile.verify_status, "").notin_(["mismatch", "missing"]),
+        )
+        .order_by(VersionFile.sha256, VersionFile.id)
+        .distinct(VersionFile.sha256)
+    )).scalars().all()
+    return {row.sha256: row for row in rows}
+
+
+async def record(db, mv, filename, s3_key, size, content_type=None, etag=None, sha256=None,
+                 verified=False, pending_blob=False):
+    """Add or replace the manifest entry of a file; the caller commits.
+
+    verified says whether sha256 was computed by the server from the stored
+    bytes rather than declared by the client; pending_blob queues a staged
+    upload for promotion to its blob.
+    """
+    values = {
+        "s3_key": s3_key,
+        "size": size,
+        "content_type": content_type or "application/octet-stream",
+        "etag": etag,
+        "sha256": sha256,
+        "sha256_verified": bool(sha256 and verified),
+        "pending_blob": pending_blob,
+        "verified_at": None,
+        "verify_status": None,
+    }
+    await db.execute(
+        insert(VersionFile)
+        .values(version_id=mv.id, filename=filename, **values)
+        .on_conflict_do_update(
+            index_elements=[VersionFile.version_id, VersionFile.filename],
+            set_=values,
+        )
+    )
+
+
+async def files(db, mv):
+    return (await db.execute(
+        select(VersionFile)
+        .where(VersionFile.version_id == mv.id)
+        .order_by(VersionFile.filename)
+    )).scalars().all()
+
+
+async def ensure(db, mv):
+    """Manifest rows of a version, backfilling them for versions that predate manifests"""
+    rows = await files(db, mv)
+    if rows:
+        return rows
+
+    prefix = mv.s3_prefix
+    contents = [obj for obj in await storage.list_objects(f"{prefix}/") if obj["Key"] != f"{prefix}/"]
+    if not contents:
+        return []
+    for obj in contents:
+        await record(db, mv, obj["Key"][len(prefix) + 1:], obj["Key"], obj["Size"], etag=obj["ETag"])
+    await db.commit()
+    return await files(db, mv)
+
+
+def ensure_intact(entries):
+    """Refuse to serve files whose stored bytes failed verification"""
+    corrupt = [entry.filename for entry in entries if entry.verify_status == "mismatch"]
+    if corrupt:
+        raise HTTPException(409, f"Stored file failed integrity verification: {', '.join(corrupt)}")
+
+
+async def resolve_object_key(db, mv, filename: str) -> str:
+    """Object key holding a version's file, via the manifest when it has an entry"""
+    entry = (await db.execute(
+        select(VersionFile).where(
+            VersionFile.version_id == mv.id,
+            VersionFile.filename == filename
+        )
+    )).scalar_one_or_none()
+    if entry is None:
+        return f"{mv.s3_prefix}/{filename}"
+    ensure_intact([entry])
+    return entry.s3_key
+
+
+async def delete_for_versions(db, version_ids):
+    """Drop manifest rows of the given versions (ids or a select of ids)"""
+    await db.execute(
+        delete(VersionFile).where(VersionFile.version_id.in_(version_ids)),
+        execution_options={"synchronize_session": False},
+    )
@@ -1,11 +1,13 @@
 
 from app.model.base import Base
-from sqlalchemy import DateTime, ForeignKey, String, UniqueConstraint, func
+from sqlalchemy import DateTime, ForeignKey, Index, String, UniqueConstraint, func
 from sqlalchemy.orm import mapped_column, Mapped, DeclarativeBase
 
 
 class Model(Base):
     __tablename__ = "models"
+    # Keyset order of the grouped model listing
+    __table_args__ = (Index("ix_models_group_variant_id", "group_name", "variant", "id"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(255), unique=True, index=True)
     group_name: Mapped[str] = mapped_column(String(255), index=True)  
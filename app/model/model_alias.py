@@ -1,12 +1,16 @@
 from app.model.base import Base
-from sqlalchemy import JSON, DateTime, ForeignKey, Integer, String, UniqueConstraint, func
+from sqlalchemy import JSON, DateTime, ForeignKey, Index, Integer, String, UniqueConstraint, func
 from sqlalchemy.orm import mapped_column, Mapped, DeclarativeBase
 from typing import Dict
 
 
 class ModelAlias(Base):
     __tablename__ = "model_aliases"
-    __table_args__ = (UniqueConstraint("model_id", "alias"),)
+    __table_args__ = (
+        UniqueConstraint("model_id", "alias"),
+        # Keyset order of the alias listing
+        Index("ix_model_aliases_model_updated_id", "model_id", "updated_at", "id"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     model_id: Mapped[int] = mapped_column(ForeignKey("models.id"))
     alias: Mapped[str] = mapped_column(String(64))
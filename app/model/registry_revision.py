@@ -0,0 +1,9 @@
+from app.model.base import Base
+from sqlalchemy import Integer, String
+from sqlalchemy.orm import mapped_column, Mapped
+
+
+class RegistryRevision(Base):
+    __tablename__ = "registry_revisions"
+    scope: Mapped[str] = mapped_column(String(600), primary_key=True)
+    revision: Mapped[int] = mapped_column(Integer, default=0)
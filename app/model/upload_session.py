@@ -0,0 +1,31 @@
+from app.model.base import Base
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Integer, String, UniqueConstraint, func
+from sqlalchemy.orm import mapped_column, Mapped
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version_id: Mapped[int] = mapped_column(ForeignKey("model_versions.id"), index=True)
+    kind: Mapped[str] = mapped_column(String(16))  # "chunked" or "direct"
+    s3_key: Mapped[str] = mapped_column(String(1024))
+    upload_id: Mapped[str] = mapped_column(String(1024))
+    filename: Mapped[str] = mapped_column(String(1024))
+    content_type: Mapped[str] = mapped_column(String(255), default="application/octet-stream")
+    status: Mapped[str] = mapped_column(String(16), default="uploading", index=True)
+    # Client-declared digest when the upload targets a content-addressed blob
+    sha256: Mapped[str] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    expires_at: Mapped[str] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+    __table_args__ = (UniqueConstraint("session_id", "part_number"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    session_id: Mapped[int] = mapped_column(ForeignKey("upload_sessions.id"))
+    part_number: Mapped[int] = mapped_column(Integer)
+    size: Mapped[int] = mapped_column(BigInteger)
+    sha256: Mapped[str] = mapped_column(String(64), nullable=True)
+    etag: Mapped[str] = mapped_column(String(128))
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
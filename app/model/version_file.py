@@ -0,0 +1,25 @@
+from app.model.base import Base
+from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, String, UniqueConstraint, func
+from sqlalchemy.orm import mapped_column, Mapped
+
+
+class VersionFile(Base):
+    __tablename__ = "version_files"
+    __table_args__ = (UniqueConstraint("version_id", "filename"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    version_id: Mapped[int] = mapped_column(ForeignKey("model_versions.id"))
+    filename: Mapped[str] = mapped_column(String(1024))
+    # Either "{s3_prefix}/{filename}", a staged upload or a shared content-addressed blob
+    s3_key: Mapped[str] = mapped_column(String(1024))
+    # Staged upload still waiting to be hashed and moved to its blob
+    pending_blob: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false", index=True)
+    sha256: Mapped[str] = mapped_column(String(64), nullable=True, index=True)
+    # False while sha256 is only what a client declared; true once the server hashed the bytes
+    sha256_verified: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
+    size: Mapped[int] = mapped_column(BigInteger)
+    content_type: Mapped[str] = mapped_column(String(255), default="application/octet-stream")
+    etag: Mapped[str] = mapped_column(String(128), nullable=True)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Set by the verifier: "ok", "mismatch" or "missing"
+    verified_at: Mapped[str] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    verify_status: Mapped[str] = mapped_column(String(16), nullable=True)
@@ -0,0 +1,64 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Opaque keyset cursors for list endpoints.
+
+A cursor encodes the sort key of the last row on a page. The next page
+continues strictly after it, so cost depends on page size rather than on
+how deep the client has paged. The cursor travels in the X-Next-Cursor
+response header so list bodies keep their shape.
+"""
+
+import base64
+import json
+
+from fastapi import HTTPException, Response
+
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types) -> list:
+    """Decode a cursor whose components must have the given types, in order"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise HTTPException(400, "Invalid cursor")
+    for value, expected in zip(values, types):
+        # JSON true/false decode to bool, which is an int subclass
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise HTTPException(400, "Invalid cursor")
+    return values
+
+
+def paginate(rows, limit, response: Response, key):
+    """Trim the extra look-ahead row and advertise the next cursor if there is one.
+
+    Queries fetch limit + 1 rows; key(row) returns the sort key tuple.
+    """
+    if limit is None or len(rows) <= limit:
+        return rows
+    rows = rows[:limit]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
+    return rows
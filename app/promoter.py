@@ -0,0 +1,129 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Background promotion of staged uploads into content-addressed blobs.
+
+With CONTENT_ADDRESSED_STORAGE, completing a chunked or direct upload only
+assembles the object under a staging key and records it with pending_blob
+set, so completion stays constant time however large the file. Each pass
+hashes pending files on the S3 pool, then links the version to a blob
+already stored under that digest or copies the object to
+"{BLOB_PREFIX}/{sha256}", and deletes the staged copy. Until then the file
+is served from its staging key and never used for deduplication. A digest
+that differs from the one the client declared marks the file "mismatch",
+which stops it being served.
+
+Passes run every BLOB_PROMOTE_INTERVAL and right after each completed
+upload, under a Postgres advisory lock.
+"""
+
+from botocore.exceptions import ClientError
+from sqlalchemy import func, select, update
+
+from app import jobs, manifest, storage
+from app.main import Session, settings
+from app.model.version_file import VersionFile
+
+# Arbitrary key for pg_try_advisory_lock, distinct from the other jobs'
+_LOCK_KEY = 0x50726F6D6F
+
+_job = jobs.Job(
+    "Blob promotion", _LOCK_KEY, "CONTENT_ADDRESSED_STORAGE", "BLOB_PROMOTE_INTERVAL",
+    files_promoted=0,
+    files_linked=0,
+    bytes_hashed=0,
+    mismatches=0,
+    missing=0,
+    errors=0,
+)
+_stats = _job.stats
+run_once = _job.run_once
+trigger = _job.trigger
+start = _job.start
+stop = _job.stop
+
+
+def stats():
+    return _job.snapshot()
+
+
+async def _settle(entry_id: int, key: str, **values):
+    """Write the outcome for a staged file, unless it was replaced meanwhile"""
+    async with Session() as db:
+        result = await db.execute(
+            update(VersionFile)
+            .where(VersionFile.id == entry_id, VersionFile.s3_key == key)
+            .values(pending_blob=False, verified_at=func.now(), **values)
+        )
+        await db.commit()
+    return result.rowcount > 0
+
+
+async def _promote(entry_id: int, key: str, declared: str):
+    try:
+        digest, size, _ = await storage.hash_object(key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        _stats["missing"] += 1
+        await _settle(entry_id, key, verify_status="missing")
+        return
+    _stats["bytes_hashed"] += size
+
+    if declared and declared != digest:
+        _stats["mismatches"] += 1
+        print(f"Warning: Upload {key} does not match its declared sha256, not served")
+        await _settle(entry_id, key, sha256_verified=False, verify_status="mismatch")
+        return
+
+    async with Session() as db:
+        existing = (await manifest.stored_blobs(db, [digest])).get(digest)
+    if existing:
+        blob_key, etag = existing.s3_key, existing.etag
+    else:
+        blob_key = manifest.blob_key(digest)
+        etag = await storage.copy_object(key, blob_key)
+    settled = await _settle(
+        entry_id, key, s3_key=blob_key, etag=etag, sha256=digest,
+        sha256_verified=True, verify_status="ok",
+    )
+    # Staging keys are unique per upload, so nothing else points at this one
+    await storage.delete_objects([key])
+    if settled:
+        _stats["files_linked" if existing else "files_promoted"] += 1
+
+
+@_job.each_pass
+async def _promote_pending():
+    last = 0
+    while True:
+        async with Session() as db:
+            rows = (await db.execute(
+                select(VersionFile.id, VersionFile.s3_key, VersionFile.sha256)
+                .where(VersionFile.pending_blob.is_(True), VersionFile.id > last)
+                .order_by(VersionFile.id)
+                .limit(settings.BLOB_PROMOTE_BATCH)
+            )).all()
+        if not rows:
+            return
+        for entry_id, key, declared in rows:
+            try:
+                await _promote(entry_id, key, declared)
+            except Exception as e:
+                # Retried on the next pass
+                _stats["errors"] += 1
+                print(f"Warning: Failed to promote {key}: {e}")
+        last = rows[-1].id
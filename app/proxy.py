@@ -0,0 +1,99 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Download proxy engine.
+
+Streams an object byte range to the client with large buffers and a bounded
+read-ahead queue, so storage reads overlap with client writes. Large ranges
+are split into segments fetched by several concurrent ranged GETs and
+re-emitted in order; memory stays bounded by the window size regardless of
+object size.
+"""
+
+import asyncio
+from collections import deque
+
+from app import storage
+from app.main import settings
+
+
+async def stream_object(key: str, start: int, end: int, etag: str = None):
+    """Yield bytes start..end (inclusive) of an object"""
+    length = end - start + 1
+    if length <= 0:
+        return
+    if settings.PROXY_PARALLEL_FETCHES > 1 and length >= settings.PROXY_PARALLEL_THRESHOLD:
+        source = _parallel_segments(key, start, end, etag)
+    else:
+        response = await storage.get_object(key, f"bytes={start}-{end}", if_match=etag)
+        source = _read_ahead(response["Body"])
+    async for chunk in source:
+        yield chunk
+
+
+async def _read_ahead(body):
+    """Read a body on the storage pool, keeping up to PROXY_READ_AHEAD buffers queued"""
+    queue = asyncio.Queue(maxsize=settings.PROXY_READ_AHEAD)
+
+    async def produce():
+        try:
+            while chunk := await storage.run(body.read, settings.PROXY_BUFFER_SIZE):
+                await queue.put(chunk)
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+        body.close()
+
+
+def _read_all(body):
+    try:
+        return body.read()
+    finally:
+        body.close()
+
+
+async def _fetch_segment(key: str, start: int, end: int, etag: str):
+    response = await storage.get_object(key, f"bytes={start}-{end}", if_match=etag)
+    return await storage.run(_read_all, response["Body"])
+
+
+async def _parallel_segments(key: str, start: int, end: int, etag: str):
+    """Fetch PROXY_SEGMENT_SIZE segments concurrently and yield them in order"""
+    segment = settings.PROXY_SEGMENT_SIZE
+    bounds = deque(
+        (offset, min(offset + segment, end + 1) - 1)
+        for offset in range(start, end + 1, segment)
+    )
+    window = deque()
+    try:
+        while bounds or window:
+            while bounds and len(window) < settings.PROXY_PARALLEL_FETCHES:
+                window.append(asyncio.create_task(_fetch_segment(key, *bounds.popleft(), etag)))
+            data = await window.popleft()
+            for offset in range(0, len(data), settings.PROXY_BUFFER_SIZE):
+                yield data[offset:offset + settings.PROXY_BUFFER_SIZE]
+    finally:
+        for task in window:
+            task.cancel()
@@ -0,0 +1,153 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""HTTP byte-range and conditional request helpers (RFC 9110)"""
+
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+# Requests asking for more ranges than this are served in full
+MAX_RANGES = 100
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def http_date(dt) -> str:
+    return format_datetime(dt, usegmt=True)
+
+
+def _parse_http_date(value: str):
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _etag_list(value: str) -> List[str]:
+    return [tag.strip() for tag in value.split(",") if tag.strip()]
+
+
+def _weak_match(a: str, b: str) -> bool:
+    return a.removeprefix("W/") == b.removeprefix("W/")
+
+
+def is_not_modified(headers, etag: str, last_modified=None) -> bool:
+    """True when If-None-Match / If-Modified-Since allow a 304"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = _etag_list(if_none_match)
+        return "*" in tags or any(_weak_match(tag, etag) for tag in tags)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        since = _parse_http_date(if_modified_since)
+        if since is not None:
+            # HTTP dates have one-second resolution
+            return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def if_range_matches(headers, etag: str, last_modified=None) -> bool:
+    """True when the Range header should be honoured per If-Range"""
+    if_range = headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Strong comparison only
+        return not if_range.startswith("W/") and if_range == etag and not etag.startswith("W/")
+    since = _parse_http_date(if_range)
+    return since is not None and last_modified is not None and \
+        last_modified.replace(microsecond=0) == since
+
+
+def parse_range(value: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a Range header into inclusive (start, end) pairs.
+
+    Returns None when the header is absent, malformed or uses another unit,
+    in which case the full representation is served. Raises
+    RangeNotSatisfiable when no range overlaps the object. Overlapping and
+    adjacent ranges are merged and the result sorted, so no byte is sent
+    twice however the ranges were written.
+    """
+    if not value:
+        return None
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        if not sep:
+            return None
+        first, last = first.strip(), last.strip()
+        try:
+            if not first:
+                # Suffix range: the final N bytes
+                length = int(last)
+                if length < 0:
+                    return None
+                if length == 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if start >= size:
+            continue
+        if end is None:
+            end = size - 1
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges or size == 0:
+        raise RangeNotSatisfiable()
+    return _coalesce(ranges)
+
+
+def _coalesce(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def byteranges_layout(ranges, size: int, content_type: str, boundary: str):
+    """Part headers and trailer of a multipart/byteranges body, plus its length"""
+    headers = [
+        (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    trailer = f"--{boundary}--\r\n".encode()
+    length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in zip(headers, ranges))
+    return headers, trailer, length + len(trailer)
@@ -0,0 +1,236 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Background reclamation of storage the registry no longer references.
+
+Deleting models, groups or aborted uploads only removes database rows. The
+reaper compares the bucket with the database and:
+
+* deletes objects under version prefixes that no longer exist, in batched
+  DeleteObjects calls of up to 1000 keys;
+* deletes content-addressed blobs that no version manifest references;
+* aborts multipart uploads older than REAPER_MULTIPART_MAX_AGE that no
+  in-progress upload refers to.
+
+Objects younger than REAPER_GRACE_PERIOD are never touched, every delete
+batch is re-checked against the database just before it is sent, deletes are
+rate limited, and a Postgres advisory lock keeps concurrent workers from
+running passes at the same time.
+"""
+
+import asyncio
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+from sqlalchemy import select
+
+from app import jobs, manifest, storage
+from app.main import Session, settings
+from app.model.model_version import ModelVersion
+from app.model.upload_session import UploadSession
+from app.model.version_file import VersionFile
+
+# Arbitrary key for pg_try_advisory_lock, shared by all workers
+_LOCK_KEY = 0x5661756C74
+
+# "{model}/versions/{n}/..." -> "{model}/versions/{n}"
+_VERSION_PREFIX = re.compile(r"^(.*?/versions/\d+)/")
+
+_job = jobs.Job(
+    "Reaper", _LOCK_KEY, "REAPER_ENABLED", "REAPER_INTERVAL",
+    dry_run=settings.REAPER_DRY_RUN,
+    objects_scanned=0,
+    orphans_found=0,
+    orphans_kept=0,
+    objects_deleted=0,
+    bytes_reclaimed=0,
+    multipart_scanned=0,
+    multipart_aborted=0,
+    errors=0,
+)
+_stats = _job.stats
+run_once = _job.run_once
+trigger = _job.trigger
+start = _job.start
+stop = _job.stop
+
+
+def stats():
+    return _job.snapshot()
+
+
+async def _known_prefixes():
+    rows = await _scalars(select(ModelVersion.s3_prefix))
+    return set(rows)
+
+
+async def _referenced_digests():
+    rows = await _scalars(
+        select(VersionFile.sha256).distinct()
+        .where(VersionFile.s3_key.startswith(f"{settings.BLOB_PREFIX}/"))
+    )
+    return set(rows)
+
+
+async def _active_upload_ids():
+    """Multipart upload ids still referenced by in-progress uploads"""
+    rows = await _scalars(
+        select(UploadSession.upload_id).where(UploadSession.status == "uploading")
+    )
+    return set(rows)
+
+
+async def _scalars(query):
+    async with Session() as db:
+        return (await db.execute(query)).scalars().all()
+
+
+class _Throttle:
+    """Spaces calls at most REAPER_BATCHES_PER_SECOND apart"""
+
+    def __init__(self):
+        self._next = 0.0
+
+    async def wait(self):
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._next = time.monotonic() + 1.0 / settings.REAPER_BATCHES_PER_SECOND
+
+
+def _is_orphan(key, known, digests):
+    if manifest.is_blob_key(key):
+        # Blobs are shared between versions: kept while any manifest names them
+        return key.rsplit("/", 1)[-1] not in digests
+    match = _VERSION_PREFIX.match(key)
+    return bool(match) and match.group(1) not in known
+
+
+async def _rewritten(key, cutoff):
+    """Whether a blob was written again (or is gone) since the listing saw it"""
+    try:
+        head = await storage.head_object(key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return True
+        raise
+    return head["LastModified"] > cutoff
+
+
+async def _still_orphaned(batch, cutoff):
+    """Entries of a batch that are still unreferenced right before deleting them.
+
+    The listing pass is compared with a snapshot taken at its start; by the
+    time a batch is full, a blob may have been linked again or a prefix
+    reused by a model recreated under the same name.
+    """
+    keys = [key for key, _ in batch]
+    digests = {key.rsplit("/", 1)[-1] for key in keys if manifest.is_blob_key(key)}
+    prefixes = {
+        match.group(1) for key in keys
+        if not manifest.is_blob_key(key) and (match := _VERSION_PREFIX.match(key))
+    }
+    known = set(await _scalars(
+        select(ModelVersion.s3_prefix).where(ModelVersion.s3_prefix.in_(prefixes))
+    )) if prefixes else set()
+    referenced = set(await _scalars(
+        select(VersionFile.sha256).where(
+            VersionFile.sha256.in_(digests),
+            VersionFile.s3_key.startswith(f"{settings.BLOB_PREFIX}/"),
+        )
+    )) if digests else set()
+
+    kept = []
+    for key, size in batch:
+        if not _is_orphan(key, known, referenced):
+            continue
+        if manifest.is_blob_key(key) and await _rewritten(key, cutoff):
+            continue
+        kept.append((key, size))
+    _stats["orphans_kept"] += len(batch) - len(kept)
+    return kept
+
+
+async def _reap_objects(known, digests, cutoff, dry_run, throttle):
+    batch_size = min(settings.REAPER_DELETE_BATCH, 1000)
+    batch = []
+
+    async def flush():
+        nonlocal batch
+        if batch and not dry_run:
+            batch = await _still_orphaned(batch, cutoff)
+        if batch and not dry_run:
+            await throttle.wait()
+            errors = await storage.delete_objects([key for key, _ in batch])
+            _stats["errors"] += len(errors)
+            _stats["objects_deleted"] += len(batch) - len(errors)
+            _stats["bytes_reclaimed"] += sum(size for _, size in batch)
+        batch = []
+
+    token = None
+    while True:
+        contents, token = await storage.list_objects_page("", token)
+        for obj in contents:
+            _stats["objects_scanned"] += 1
+            if obj["LastModified"] > cutoff or not _is_orphan(obj["Key"], known, digests):
+                continue
+            _stats["orphans_found"] += 1
+            batch.append((obj["Key"], obj["Size"]))
+            if len(batch) >= batch_size:
+                await flush()
+        if not token:
+            break
+    await flush()
+
+
+async def _reap_multipart(active, dry_run, throttle):
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.REAPER_MULTIPART_MAX_AGE)
+    key_marker = upload_id_marker = None
+    while True:
+        page = await storage.list_multipart_uploads(key_marker, upload_id_marker)
+        for upload in page.get("Uploads", []):
+            _stats["multipart_scanned"] += 1
+            if upload["UploadId"] in active or upload["Initiated"] > cutoff:
+                continue
+            if dry_run:
+                continue
+            await throttle.wait()
+            try:
+                await storage.abort_multipart_upload(upload["Key"], upload["UploadId"])
+                _stats["multipart_aborted"] += 1
+            except Exception as e:
+                _stats["errors"] += 1
+                print(f"Warning: Failed to abort multipart upload {upload['UploadId']}: {e}")
+        if not page.get("IsTruncated"):
+            break
+        key_marker = page.get("NextKeyMarker")
+        upload_id_marker = page.get("NextUploadIdMarker")
+
+
+@_job.each_pass
+async def _reap(dry_run: bool = None):
+    dry_run = settings.REAPER_DRY_RUN if dry_run is None else dry_run
+    _stats["dry_run"] = dry_run
+    # Objects must predate the DB snapshot by the grace period, so a
+    # version declared after the snapshot is never mistaken for an orphan
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.REAPER_GRACE_PERIOD)
+    throttle = _Throttle()
+    await _reap_objects(
+        await _known_prefixes(), await _referenced_digests(), cutoff, dry_run, throttle
+    )
+    await _reap_multipart(await _active_upload_ids(), dry_run, throttle)
@@ -0,0 +1,88 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Revision counters backing ETags on registry read endpoints.
+
+Every registry write bumps the counters of the scopes it touches, in the same
+transaction: the whole registry, the model (by name) and its group/variant.
+Readers turn the current revision into a strong ETag, so a matching
+If-None-Match is answered with a 304 after a single primary-key lookup.
+"""
+
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app import ranges
+from app.model.registry_revision import RegistryRevision
+
+REGISTRY = "registry"
+
+
+def model_scope(name: str) -> str:
+    return f"model:{name}"
+
+
+def variant_scope(group_name: str, variant: str) -> str:
+    return f"variant:{group_name}:{variant}"
+
+
+async def bump_models(db, *models):
+    """Bump the revisions a write to these models invalidates; caller commits"""
+    scopes = {REGISTRY}
+    for m in models:
+        scopes.add(model_scope(m.name))
+        scopes.add(variant_scope(m.group_name, m.variant))
+    # Sorted so concurrent writers lock rows in the same order
+    stmt = insert(RegistryRevision).values(
+        [{"scope": scope, "revision": 1} for scope in sorted(scopes)]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RegistryRevision.scope],
+        set_={"revision": RegistryRevision.revision + 1},
+    )
+    await db.execute(stmt)
+
+
+async def current(db, scope: str) -> int:
+    revision = (await db.execute(
+        select(RegistryRevision.revision).where(RegistryRevision.scope == scope)
+    )).scalar_one_or_none()
+    return revision or 0
+
+
+def make_etag(scope: str, revision: int, discriminator: str = "") -> str:
+    """Strong ETag for a revision; discriminator separates bodies served per scope"""
+    digest = hashlib.sha1(f"{scope}?{discriminator}".encode()).hexdigest()[:16]
+    return f'"{revision}-{digest}"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 response when the client's If-None-Match matches, else None"""
+    if ranges.is_not_modified(request.headers, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+async def conditional(db, request: Request, response: Response, scope: str) -> Optional[Response]:
+    """Return a 304 if the client's ETag is current, else set the ETag on response"""
+    # Different query strings on the same path produce different bodies
+    etag = make_etag(scope, await current(db, scope), request.url.query)
+    response.headers["ETag"] = etag
+    return not_modified(request, etag)
@@ -15,20 +15,67 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import hashlib
+import threading
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from .main import settings
 
-def s3_client():
-    return boto3.client(
+_client = None
+_presign_client = None
+_client_lock = threading.Lock()
+
+def _build_client(endpoint_url: str):
+    return boto3.session.Session().client(
         "s3",
-        endpoint_url=settings.S3_ENDPOINT,
+        endpoint_url=endpoint_url,
         aws_access_key_id=settings.S3_ACCESS_KEY,
         aws_secret_access_key=settings.S3_SECRET_KEY,
         region_name=settings.S3_REGION,
+        config=Config(
+            max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.S3_CONNECT_TIMEOUT,
+            read_timeout=settings.S3_READ_TIMEOUT,
+            retries={
+                "max_attempts": settings.S3_MAX_ATTEMPTS,
+                "mode": settings.S3_RETRY_MODE,
+            },
+            tcp_keepalive=settings.S3_TCP_KEEPALIVE,
+        ),
     )
 
+def s3_client():
+    """Return the process-wide S3 client.
+
+    boto3 clients are thread-safe, so a single instance (and its urllib3
+    connection pool) is shared by every request instead of being rebuilt
+    per call.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client(settings.S3_ENDPOINT)
+    return _client
+
+def presign_client():
+    """Client used to sign URLs handed out to API clients.
+
+    Signatures cover the host, so when storage is reachable under a different
+    address from outside (S3_PUBLIC_ENDPOINT) URLs are signed against that.
+    """
+    global _presign_client
+    if not settings.S3_PUBLIC_ENDPOINT:
+        return s3_client()
+    if _presign_client is None:
+        with _client_lock:
+            if _presign_client is None:
+                _presign_client = _build_client(settings.S3_PUBLIC_ENDPOINT)
+    return _presign_client
+
 def presign_put(key: str, content_type: str = "application/octet-stream", expires=3600):
-    s3 = s3_client()
+    s3 = presign_client()
     return s3.generate_presigned_url(
         "put_object",
         Params={"Bucket": settings.S3_BUCKET, "Key": key, "ContentType": content_type},
@@ -36,7 +83,7 @@ def presign_put(key: str, content_type: str = "application/octet-stream", expire
     )
 
 def ensure_bucket_exists():
-    """Create bucket if it doesn't exist"""
+    """Create bucket if it doesn't exist. Called once at startup."""
     s3 = s3_client()
     try:
         s3.head_bucket(Bucket=settings.S3_BUCKET)
@@ -48,7 +95,6 @@ def ensure_bucket_exists():
 
 def upload_file(file_content: bytes, key: str, content_type: str = "application/octet-stream"):
     """Upload file content directly to S3"""
-    ensure_bucket_exists()
     s3 = s3_client()
     s3.put_object(
         Bucket=settings.S3_BUCKET,
@@ -58,9 +104,108 @@ def upload_file(file_content: bytes, key: str, content_type: str = "application/
     )
     return f"s3://{settings.S3_BUCKET}/{key}"
 
+def upload_fileobj(fileobj, key: str, content_type: str = "application/octet-stream"):
+    """Stream a file-like object to S3, switching to multipart above the threshold"""
+    s3 = s3_client()
+    s3.upload_fileobj(
+        fileobj,
+        settings.S3_BUCKET,
+        key,
+        ExtraArgs={"ContentType": content_type},
+        Config=TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.S3_TRANSFER_CONCURRENCY,
+        ),
+    )
+    return f"s3://{settings.S3_BUCKET}/{key}"
+
+def put_object(key: str, body: bytes, content_type: str = "application/octet-stream"):
+    """Store a small in-memory object in one request and return its ETag"""
+    s3 = s3_client()
+    response = s3.put_object(
+        Bucket=settings.S3_BUCKET, Key=key, Body=body, ContentType=content_type
+    )
+    return response["ETag"]
+
+def copy_object(source_key: str, key: str):
+    """Server-side copy within the bucket and return the new ETag.
+
+    The managed copy switches to UploadPartCopy above the multipart
+    threshold, so objects past the 5 GB CopyObject limit work too.
+    """
+    s3 = s3_client()
+    s3.copy(
+        {"Bucket": settings.S3_BUCKET, "Key": source_key},
+        settings.S3_BUCKET,
+        key,
+        Config=TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.S3_TRANSFER_CONCURRENCY,
+        ),
+    )
+    return head_object(key)["ETag"]
+
+def get_object(key: str, range_header: str = None, if_match: str = None):
+    """Open an object for reading; the caller consumes response['Body']"""
+    s3 = s3_client()
+    params = {"Bucket": settings.S3_BUCKET, "Key": key}
+    if range_header:
+        params["Range"] = range_header
+    if if_match:
+        params["IfMatch"] = if_match
+    return s3.get_object(**params)
+
+def hash_object(key: str, chunk_size: int = 1024 * 1024):
+    """Stream an object and return (sha256 hex digest, size, ETag)"""
+    response = get_object(key)
+    digest = hashlib.sha256()
+    size = 0
+    body = response["Body"]
+    try:
+        while chunk := body.read(chunk_size):
+            digest.update(chunk)
+            size += len(chunk)
+    finally:
+        body.close()
+    return digest.hexdigest(), size, response["ETag"]
+
+def head_object(key: str):
+    """Fetch object metadata without the body"""
+    s3 = s3_client()
+    return s3.head_object(Bucket=settings.S3_BUCKET, Key=key)
+
+def list_objects(prefix: str):
+    """List every object under a prefix, following continuation tokens"""
+    s3 = s3_client()
+    paginator = s3.get_paginator("list_objects_v2")
+    objects = []
+    for page in paginator.paginate(Bucket=settings.S3_BUCKET, Prefix=prefix):
+        objects.extend(page.get("Contents", []))
+    return objects
+
+def list_objects_page(prefix: str = "", continuation_token: str = None, max_keys: int = 1000):
+    """One page of a bucket listing; returns (objects, next continuation token)"""
+    s3 = s3_client()
+    params = {"Bucket": settings.S3_BUCKET, "Prefix": prefix, "MaxKeys": max_keys}
+    if continuation_token:
+        params["ContinuationToken"] = continuation_token
+    response = s3.list_objects_v2(**params)
+    return response.get("Contents", []), response.get("NextContinuationToken")
+
+def delete_objects(keys):
+    """Delete up to 1000 keys in one request; returns the per-key errors"""
+    s3 = s3_client()
+    response = s3.delete_objects(
+        Bucket=settings.S3_BUCKET,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+    )
+    return response.get("Errors", [])
+
 def presign_get(key: str, expires=3600):
     """Generate presigned URL for downloading files"""
-    s3 = s3_client()
+    s3 = presign_client()
     return s3.generate_presigned_url(
         "get_object",
         Params={"Bucket": settings.S3_BUCKET, "Key": key},
@@ -69,7 +214,6 @@ def presign_get(key: str, expires=3600):
 
 def create_multipart_upload(key: str, content_type: str = "application/octet-stream"):
     """Initiate a multipart upload"""
-    ensure_bucket_exists()
     s3 = s3_client()
     response = s3.create_multipart_upload(
         Bucket=settings.S3_BUCKET,
@@ -80,7 +224,7 @@ def create_multipart_upload(key: str, content_type: str = "application/octet-str
 
 def presign_upload_part(key: str, upload_id: str, part_number: int, expires=3600):
     """Generate presigned URL for uploading a part"""
-    s3 = s3_client()
+    s3 = presign_client()
     return s3.generate_presigned_url(
         "upload_part",
         Params={
@@ -92,6 +236,23 @@ def presign_upload_part(key: str, upload_id: str, part_number: int, expires=3600
         ExpiresIn=expires,
     )
 
+def presign_upload_parts(key: str, upload_id: str, part_numbers, expires=3600):
+    """Generate presigned URLs for a batch of parts"""
+    return [presign_upload_part(key, upload_id, num, expires) for num in part_numbers]
+
+def upload_part(key: str, upload_id: str, part_number: int, body, content_length: int):
+    """Upload one part of a multipart upload and return its ETag"""
+    s3 = s3_client()
+    response = s3.upload_part(
+        Bucket=settings.S3_BUCKET,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=body,
+        ContentLength=content_length,
+    )
+    return response['ETag']
+
 def complete_multipart_upload(key: str, upload_id: str, parts):
     """Complete a multipart upload"""
     s3 = s3_client()
@@ -112,8 +273,22 @@ def abort_multipart_upload(key: str, upload_id: str):
         UploadId=upload_id
     )
 
-def list_multipart_uploads():
-    """List ongoing multipart uploads"""
+def list_parts(key: str, upload_id: str):
+    """Every part S3 has received for a multipart upload"""
+    s3 = s3_client()
+    paginator = s3.get_paginator("list_parts")
+    parts = []
+    for page in paginator.paginate(Bucket=settings.S3_BUCKET, Key=key, UploadId=upload_id):
+        parts.extend(page.get("Parts", []))
+    return parts
+
+def list_multipart_uploads(key_marker: str = None, upload_id_marker: str = None):
+    """List ongoing multipart uploads, one page at a time"""
     s3 = s3_client()
-    return s3.list_multipart_uploads(Bucket=settings.S3_BUCKET)
+    params = {"Bucket": settings.S3_BUCKET}
+    if key_marker:
+        params["KeyMarker"] = key_marker
+    if upload_id_marker:
+        params["UploadIdMarker"] = upload_id_marker
+    return s3.list_multipart_uploads(**params)
 
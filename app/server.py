@@ -26,6 +26,7 @@ from fastapi import FastAPI, Request
 from colorama import Fore, Style, init as colorama_init
 from app.api import router
 from app.main import Session, init_db
+from app import disk_guard, promoter, reaper, storage, sweeper, verifier
 from app.model.user import User
 colorama_init(autoreset=True)
 
@@ -52,6 +53,15 @@ def print_agpl_banner():
 print_agpl_banner()
 app = FastAPI(title="VaultML")
 app.include_router(router)
+
+@app.middleware("http")
+async def disk_guard_mw(request: Request, call_next):
+    # Runs before the body is read, and inside CORS so browsers see the status
+    rejection = disk_guard.check(request.method, request.url.path)
+    if rejection is not None:
+        return rejection
+    return await call_next(request)
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app.add_middleware(
@@ -60,6 +70,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 @app.get("/health")
@@ -95,7 +106,21 @@ app.mount("/", StaticFiles(directory=nuxt_build_dir, html=True), name="nuxt")
 @app.on_event("startup")
 async def startup_event():
     await init_db()
+    await storage.ensure_bucket_exists()
     await create_default_user()
+    reaper.start()
+    sweeper.start()
+    verifier.start()
+    promoter.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await reaper.stop()
+    await sweeper.stop()
+    await verifier.stop()
+    await promoter.stop()
+    storage.shutdown()
 
 
 async def create_default_user():
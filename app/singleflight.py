@@ -0,0 +1,67 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Request coalescing.
+
+A Group runs at most one computation per key at a time: callers that arrive
+while one is in flight await the same result (or exception) instead of
+repeating the work. The computation runs as its own task, so a caller that
+disconnects does not cancel it for the others; it must therefore not use
+request-scoped resources such as the request's DB session.
+"""
+
+import asyncio
+
+_groups = {}
+
+
+class Group:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0}
+
+    async def do(self, key, fn):
+        """Result of fn() for key, shared with every concurrent caller of the same key"""
+        self._stats["calls"] += 1
+        future = self._calls.get(key)
+        if future is None:
+            self._stats["executions"] += 1
+            future = self._calls[key] = asyncio.ensure_future(fn())
+            future.add_done_callback(lambda f: self._finished(key, f))
+        else:
+            self._stats["coalesced"] += 1
+        return await asyncio.shield(future)
+
+    def _finished(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled() and future.exception() is not None:
+            self._stats["errors"] += 1
+
+    def stats(self):
+        return dict(self._stats, in_flight=len(self._calls))
+
+
+def group(name: str) -> Group:
+    """The process-wide group with this name"""
+    if name not in _groups:
+        _groups[name] = Group(name)
+    return _groups[name]
+
+
+def stats():
+    return {name: g.stats() for name, g in _groups.items()}
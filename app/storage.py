@@ -0,0 +1,165 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Async facade over app.s3.
+
+boto3 is blocking, so every storage call is handed to a dedicated, bounded
+thread pool instead of running on the event loop. The pool is separate from
+Starlette's default threadpool, so a long upload can never starve the
+cheap registry endpoints of workers.
+"""
+
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import s3
+from app.cache import TTLCache
+from app.main import settings
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.S3_IO_THREADS, thread_name_prefix="s3-io"
+)
+_slots = asyncio.Semaphore(settings.S3_IO_QUEUE_LIMIT)
+
+# Signed GET URLs are reused until PRESIGN_CACHE_MARGIN seconds before expiry
+_presigned = TTLCache(
+    settings.PRESIGN_CACHE_SIZE,
+    max(settings.S3_PRESIGN_EXPIRES - settings.PRESIGN_CACHE_MARGIN, 0),
+)
+
+_lock = threading.Lock()
+_stats = {
+    "waiting": 0,
+    "queued": 0,
+    "active": 0,
+    "completed": 0,
+    "failed": 0,
+    "queue_wait_total": 0.0,
+    "queue_wait_max": 0.0,
+}
+
+
+def _bump(**deltas):
+    with _lock:
+        for k, v in deltas.items():
+            _stats[k] += v
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking storage callable on the S3 I/O pool"""
+    _bump(waiting=1)
+    async with _slots:
+        _bump(waiting=-1, queued=1)
+        submitted = time.monotonic()
+
+        def call():
+            wait = time.monotonic() - submitted
+            with _lock:
+                _stats["queued"] -= 1
+                _stats["active"] += 1
+                _stats["queue_wait_total"] += wait
+                _stats["queue_wait_max"] = max(_stats["queue_wait_max"], wait)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                _bump(active=-1, failed=1)
+                raise
+            _bump(active=-1, completed=1)
+            return result
+
+        return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+
+def stats():
+    """Pool sizing and queue metrics"""
+    with _lock:
+        snapshot = dict(_stats)
+    done = snapshot["completed"] + snapshot["failed"]
+    snapshot["queue_wait_avg"] = snapshot["queue_wait_total"] / done if done else 0.0
+    snapshot["threads"] = settings.S3_IO_THREADS
+    snapshot["queue_limit"] = settings.S3_IO_QUEUE_LIMIT
+    snapshot["presign_cache"] = _presigned.stats()
+    return snapshot
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _wrap(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+
+ensure_bucket_exists = _wrap(s3.ensure_bucket_exists)
+presign_put = _wrap(s3.presign_put)
+upload_file = _wrap(s3.upload_file)
+upload_fileobj = _wrap(s3.upload_fileobj)
+put_object = _wrap(s3.put_object)
+copy_object = _wrap(s3.copy_object)
+get_object = _wrap(s3.get_object)
+head_object = _wrap(s3.head_object)
+hash_object = _wrap(s3.hash_object)
+list_objects = _wrap(s3.list_objects)
+list_objects_page = _wrap(s3.list_objects_page)
+delete_objects = _wrap(s3.delete_objects)
+presign_get = _wrap(s3.presign_get)
+create_multipart_upload = _wrap(s3.create_multipart_upload)
+presign_upload_part = _wrap(s3.presign_upload_part)
+presign_upload_parts = _wrap(s3.presign_upload_parts)
+upload_part = _wrap(s3.upload_part)
+complete_multipart_upload = _wrap(s3.complete_multipart_upload)
+abort_multipart_upload = _wrap(s3.abort_multipart_upload)
+list_multipart_uploads = _wrap(s3.list_multipart_uploads)
+list_parts = _wrap(s3.list_parts)
+
+
+async def presign_get_cached(key: str) -> str:
+    """Presigned GET URL for a key, served from cache while still fresh"""
+    url = _presigned.get(key)
+    if url is None:
+        url = await presign_get(key, settings.S3_PRESIGN_EXPIRES)
+        _presigned.set(key, url)
+    return url
+
+
+def _sha256(fileobj, chunk_size: int = 1024 * 1024) -> str:
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    while chunk := fileobj.read(chunk_size):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+async def sha256_fileobj(fileobj) -> str:
+    """Hex SHA-256 of a seekable file, hashed on the I/O pool and rewound"""
+    return await run(_sha256, fileobj)
+
+
+async def iter_body(body, chunk_size: int = 1024 * 1024):
+    """Read a botocore StreamingBody on the I/O pool without blocking the loop"""
+    try:
+        while chunk := await run(body.read, chunk_size):
+            yield chunk
+    finally:
+        body.close()
@@ -0,0 +1,193 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Expiry of abandoned upload sessions.
+
+An upload session lives UPLOAD_SESSION_TTL seconds past its last activity.
+Every UPLOAD_SWEEP_INTERVAL the sweeper:
+
+* aborts the S3 multipart upload of each expired session and drops its
+  recorded parts; sessions whose completion failed expire the same way;
+* marks the half-declared version "expired", or deletes it when
+  UPLOAD_SWEEP_REMOVE_VERSIONS is set and nothing was stored under it;
+* purges chunk staging directories left on local disk by older releases.
+
+Like the reaper, a pass holds a Postgres advisory lock so only one worker
+sweeps at a time.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, or_, select
+
+from app import jobs, manifest, revisions, storage
+from app.cache import invalidate_models
+from app.main import Session, settings
+from app.model.model import Model
+from app.model.model_version import ModelVersion
+from app.model.upload_session import UploadPart, UploadSession
+
+# Arbitrary key for pg_try_advisory_lock, distinct from the reaper's
+_LOCK_KEY = 0x5377656570
+
+_job = jobs.Job(
+    "Upload sweep", _LOCK_KEY, "UPLOAD_SWEEP_ENABLED", "UPLOAD_SWEEP_INTERVAL",
+    sessions_expired=0,
+    multipart_aborted=0,
+    versions_marked=0,
+    versions_removed=0,
+    staging_dirs_purged=0,
+    staging_bytes_purged=0,
+    errors=0,
+)
+_stats = _job.stats
+run_once = _job.run_once
+start = _job.start
+stop = _job.stop
+
+
+def stats():
+    return _job.snapshot()
+
+
+def expiry():
+    """Expiry timestamp for a session active now"""
+    return datetime.now(timezone.utc) + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+def _expired_clause(now):
+    # Sessions opened before expires_at existed age out from created_at.
+    # Failed sessions expire too, so their versions don't stay "uploading"
+    return and_(
+        UploadSession.status.in_(["uploading", "failed"]),
+        or_(
+            UploadSession.expires_at < now,
+            and_(
+                UploadSession.expires_at.is_(None),
+                UploadSession.created_at < now - timedelta(seconds=settings.UPLOAD_SESSION_TTL),
+            ),
+        ),
+    )
+
+
+async def _stored_anything(db, mv) -> bool:
+    if await manifest.files(db, mv):
+        return True
+    contents, _ = await storage.list_objects_page(f"{mv.s3_prefix}/", max_keys=1)
+    return bool(contents)
+
+
+async def _expire_sessions():
+    now = datetime.now(timezone.utc)
+    async with Session() as db:
+        rows = (await db.execute(
+            select(UploadSession, ModelVersion, Model)
+            .join(ModelVersion, ModelVersion.id == UploadSession.version_id)
+            .join(Model, Model.id == ModelVersion.model_id)
+            .where(_expired_clause(now))
+        )).all()
+        if not rows:
+            return
+
+        for session, mv, m in rows:
+            if session.status == "failed":
+                # Its multipart upload was already completed and discarded
+                session.status = "expired"
+                _stats["sessions_expired"] += 1
+                continue
+            try:
+                await storage.abort_multipart_upload(session.s3_key, session.upload_id)
+                _stats["multipart_aborted"] += 1
+            except Exception as e:
+                # Already completed or aborted on the storage side; the row still expires
+                _stats["errors"] += 1
+                print(f"Warning: Failed to abort multipart upload {session.upload_id}: {e}")
+            session.status = "expired"
+            _stats["sessions_expired"] += 1
+
+        session_ids = [session.id for session, _, _ in rows]
+        await db.execute(delete(UploadPart).where(UploadPart.session_id.in_(session_ids)))
+
+        # A version is half-declared if its only upload never finished; one
+        # that picked up a fresh session since stays untouched
+        live = set((await db.execute(
+            select(UploadSession.version_id).where(
+                UploadSession.version_id.in_([mv.id for _, mv, _ in rows]),
+                UploadSession.status == "uploading",
+                UploadSession.id.notin_(session_ids),
+            )
+        )).scalars().all())
+
+        touched = {}
+        for _, mv, m in rows:
+            if mv.id in live or mv.id in touched or (mv.tags or {}).get("status") != "uploading":
+                continue
+            touched[mv.id] = m
+            if settings.UPLOAD_SWEEP_REMOVE_VERSIONS and not await _stored_anything(db, mv):
+                sessions = select(UploadSession.id).where(UploadSession.version_id == mv.id)
+                await db.execute(delete(UploadPart).where(UploadPart.session_id.in_(sessions)))
+                await db.execute(delete(UploadSession).where(UploadSession.version_id == mv.id))
+                await db.delete(mv)
+                _stats["versions_removed"] += 1
+            else:
+                tags = mv.tags.copy()
+                tags["status"] = "expired"
+                mv.tags = tags
+                _stats["versions_marked"] += 1
+
+        models = list({m.id: m for m in touched.values()}.values())
+        if models:
+            await revisions.bump_models(db, *models)
+        await db.commit()
+        invalidate_models(*models)
+
+
+def _purge_staging(cutoff: float):
+    root = settings.UPLOAD_LEGACY_STAGING_DIR
+    if not root or not os.path.isdir(root):
+        return 0, 0
+    dirs = purged = 0
+    for entry in os.scandir(root):
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                for parent, _, files in os.walk(entry.path):
+                    for name in files:
+                        purged += os.lstat(os.path.join(parent, name)).st_size
+                shutil.rmtree(entry.path)
+            else:
+                purged += entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+            dirs += 1
+        except OSError as e:
+            _stats["errors"] += 1
+            print(f"Warning: Failed to purge staging entry {entry.path}: {e}")
+    return dirs, purged
+
+
+@_job.each_pass
+async def _sweep():
+    await _expire_sessions()
+    dirs, purged = await asyncio.to_thread(
+        _purge_staging, time.time() - settings.UPLOAD_SESSION_TTL
+    )
+    _stats["staging_dirs_purged"] += dirs
+    _stats["staging_bytes_purged"] += purged
@@ -0,0 +1,165 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Server-side expansion of an uploaded tar stream into individual objects.
+
+The request body is handed to tarfile in stream mode ("r|*", so gzip, bz2
+and xz are accepted too) running on a worker thread; the thread pulls body
+chunks from the event loop one at a time, so nothing is buffered beyond the
+member being uploaded. Members up to TAR_SMALL_MEMBER_SIZE are read into
+memory and stored with UPLOAD_CONCURRENCY PutObject calls in flight; larger
+ones are streamed through a multipart transfer before the next member is
+read. Every member is hashed with SHA-256 as its bytes pass through.
+
+A failed expansion returns only once every put it started has finished, so
+nothing lands under the version after the caller has cleaned it up. Member
+names must be unique within the archive.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import io
+import mimetypes
+import posixpath
+import tarfile
+import threading
+
+from app import storage
+from app.main import settings
+
+
+class UnsafeMemberError(ValueError):
+    pass
+
+
+class _StreamReader(io.RawIOBase):
+    """Blocking file object over an async byte stream, read from a worker thread"""
+
+    def __init__(self, chunks, loop):
+        self._chunks = chunks.__aiter__()
+        self._loop = loop
+        self._buffer = b""
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    async def _next(self):
+        return await anext(self._chunks, None)
+
+    def readinto(self, b):
+        while not self._buffer and not self._eof:
+            chunk = asyncio.run_coroutine_threadsafe(self._next(), self._loop).result()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer = chunk
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class _Hashing:
+    """Non-seekable reader that hashes what passes through it"""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+
+def _member_name(member):
+    name = posixpath.normpath(member.name.lstrip("/"))
+    if name in (".", "") or name.startswith("../") or name == "..":
+        raise UnsafeMemberError(f"Refusing tar member outside the version: {member.name}")
+    return name
+
+
+def _settle(pending):
+    """Wait for every put already handed to the S3 pool, ignoring their outcome"""
+    concurrent.futures.wait([future for future, _ in pending])
+
+
+def _expand(reader, prefix, loop):
+    def call(coro):
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    slots = threading.BoundedSemaphore(settings.UPLOAD_CONCURRENCY)
+    pending = []
+    results = []
+    seen = set()
+
+    try:
+        with tarfile.open(fileobj=reader, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                name = _member_name(member)
+                if name in seen:
+                    # A second put to the same key would race the first one
+                    raise UnsafeMemberError(f"Duplicate tar member: {member.name}")
+                seen.add(name)
+                key = f"{prefix}/{name}"
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                body = tar.extractfile(member)
+                entry = {"filename": name, "s3_key": key, "content_type": content_type}
+
+                if member.size <= settings.TAR_SMALL_MEMBER_SIZE:
+                    data = body.read()
+                    entry.update(size=len(data), sha256=hashlib.sha256(data).hexdigest())
+                    slots.acquire()
+                    # Fail fast instead of reading the rest of a doomed upload
+                    for future, _ in pending:
+                        if future.done() and future.exception():
+                            slots.release()
+                            raise future.exception()
+                    future = asyncio.run_coroutine_threadsafe(
+                        storage.put_object(key, data, content_type), loop
+                    )
+                    future.add_done_callback(lambda _: slots.release())
+                    pending.append((future, entry))
+                else:
+                    hashing = _Hashing(body)
+                    call(storage.upload_fileobj(hashing, key, content_type))
+                    head = call(storage.head_object(key))
+                    entry.update(
+                        size=hashing.size, sha256=hashing.sha256.hexdigest(), etag=head["ETag"]
+                    )
+                results.append(entry)
+
+        for future, entry in pending:
+            entry["etag"] = future.result()
+    except BaseException:
+        # The caller deletes the version once this raises; no object may land
+        # after that. A PutObject already running on the pool cannot be
+        # interrupted, and at most UPLOAD_CONCURRENCY are, so wait them out.
+        _settle(pending)
+        raise
+    return results
+
+
+async def expand_tar(chunks, prefix: str):
+    """Store every regular file of a tar stream under prefix; returns their manifest fields"""
+    loop = asyncio.get_running_loop()
+    return await asyncio.to_thread(_expand, _StreamReader(chunks, loop), prefix, loop)
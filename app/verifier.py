@@ -0,0 +1,178 @@
+
+# Copyright (C) 2025 All-Day Developer Marcin Wawrzków
+# contributor: Marcin Wawrzków
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""Background verification of stored files against their manifest.
+
+Each pass re-reads files never verified, or last verified more than
+VERIFY_REVERIFY_AFTER seconds ago, in batches of VERIFY_BATCH. It hashes
+the stored bytes and records the result on the manifest row:
+
+* "ok" when size and SHA-256 match; digests missing from the manifest
+  (multipart uploads, backfilled legacy versions) are filled in;
+* "mismatch" when either differs;
+* "missing" when the object is gone.
+
+Mismatched files are no longer served or used for deduplication, and a
+corrupt shared blob marks every manifest row pointing at it. Shared blobs
+are hashed once per batch. A Postgres advisory lock keeps
+workers from verifying concurrently.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+from sqlalchemy import func, or_, select, update
+
+from app import jobs, manifest, storage
+from app.main import Session, settings
+from app.model.version_file import VersionFile
+
+# Arbitrary key for pg_try_advisory_lock, distinct from the reaper's and sweeper's
+_LOCK_KEY = 0x5665726966
+
+_job = jobs.Job(
+    "Verification", _LOCK_KEY, "VERIFY_ENABLED", "VERIFY_INTERVAL",
+    files_verified=0,
+    objects_hashed=0,
+    bytes_hashed=0,
+    digests_backfilled=0,
+    mismatches=0,
+    last_mismatch=None,
+    missing=0,
+    errors=0,
+)
+_stats = _job.stats
+run_once = _job.run_once
+trigger = _job.trigger
+start = _job.start
+stop = _job.stop
+
+
+def stats():
+    return _job.snapshot()
+
+
+# Marks an object whose hashing failed, as opposed to None for a missing one
+_FAILED = object()
+
+
+async def _hash(key):
+    """(digest, size, etag) of an object, or None if it does not exist"""
+    try:
+        result = await storage.hash_object(key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+    _stats["objects_hashed"] += 1
+    _stats["bytes_hashed"] += result[1]
+    return result
+
+
+def _check(entry, hashed, now):
+    entry.verified_at = now
+    if hashed is None:
+        entry.verify_status = "missing"
+        _stats["missing"] += 1
+        return
+    digest, size, etag = hashed
+    if entry.sha256 is None and size == entry.size:
+        entry.sha256 = digest
+        _stats["digests_backfilled"] += 1
+    entry.etag = entry.etag or etag
+    if entry.sha256 == digest and entry.size == size:
+        entry.verify_status = "ok"
+        # A declared digest is trusted for deduplication once the bytes match it
+        entry.sha256_verified = True
+    else:
+        entry.verify_status = "mismatch"
+        entry.sha256_verified = False
+        _stats["mismatches"] += 1
+        _stats["last_mismatch"] = {"s3_key": entry.s3_key, "version_file": entry.id, "at": now.isoformat()}
+        print(f"Warning: Checksum mismatch for {entry.s3_key} (version file {entry.id}), no longer served")
+    _stats["files_verified"] += 1
+
+
+async def _verify_batch(started):
+    """Verify one batch of due files; returns how many were checked.
+
+    Hashing a batch can take hours, so no session is held meanwhile: the
+    batch is read in one short session and the results written in another.
+    """
+    stale = started - timedelta(seconds=settings.VERIFY_REVERIFY_AFTER)
+    async with Session() as db:
+        due = (await db.execute(
+            select(VersionFile.id, VersionFile.s3_key, VersionFile.etag)
+            .where(
+                or_(VersionFile.verified_at.is_(None), VersionFile.verified_at < stale),
+                # Staged uploads are hashed by the promoter
+                VersionFile.pending_blob.is_(False),
+            )
+            .order_by(VersionFile.verified_at.asc().nulls_first(), VersionFile.id)
+            .limit(settings.VERIFY_BATCH)
+        )).all()
+    if not due:
+        return 0
+
+    hashed = {}
+    for _, key, _ in due:
+        if key in hashed:
+            continue
+        try:
+            hashed[key] = await _hash(key)
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"Warning: Failed to verify {key}: {e}")
+            # Retried once the row is due again
+            hashed[key] = _FAILED
+
+    async with Session() as db:
+        entries = (await db.execute(
+            select(VersionFile).where(VersionFile.id.in_([id for id, _, _ in due]))
+        )).scalars().all()
+        loaded = {id: (key, etag) for id, key, etag in due}
+        for entry in entries:
+            if loaded[entry.id] != (entry.s3_key, entry.etag):
+                # Replaced while we were hashing; left due, so the new bytes are checked next
+                continue
+            result = hashed[entry.s3_key]
+            if result is _FAILED:
+                entry.verified_at = datetime.now(timezone.utc)
+                continue
+            _check(entry, result, datetime.now(timezone.utc))
+
+        corrupt_blobs = {
+            entry.s3_key for entry in entries
+            if entry.verify_status == "mismatch" and manifest.is_blob_key(entry.s3_key)
+        }
+        if corrupt_blobs:
+            # Other versions linking the same blob must stop serving it too
+            await db.execute(
+                update(VersionFile)
+                .where(VersionFile.s3_key.in_(corrupt_blobs))
+                .values(verify_status="mismatch", sha256_verified=False, verified_at=func.now()),
+                execution_options={"synchronize_session": False},
+            )
+        await db.commit()
+    return len(due)
+
+
+@_job.each_pass
+async def _verify():
+    started = datetime.now(timezone.utc)
+    # Rows verified during this pass move past `started`, so the loop ends
+    while await _verify_batch(started) == settings.VERIFY_BATCH:
+        pass
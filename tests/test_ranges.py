@@ -0,0 +1,65 @@
+import pytest
+
+from app import ranges
+
+
+def test_absent_malformed_or_other_unit_serves_in_full():
+    assert ranges.parse_range(None, 100) is None
+    assert ranges.parse_range("", 100) is None
+    assert ranges.parse_range("items=0-1", 100) is None
+    assert ranges.parse_range("bytes=abc", 100) is None
+    assert ranges.parse_range("bytes=5-2", 100) is None
+
+
+def test_single_ranges():
+    assert ranges.parse_range("bytes=0-9", 100) == [(0, 9)]
+    assert ranges.parse_range("bytes=90-", 100) == [(90, 99)]
+    assert ranges.parse_range("bytes=-10", 100) == [(90, 99)]
+    assert ranges.parse_range("bytes=-500", 100) == [(0, 99)]
+    assert ranges.parse_range("bytes=50-500", 100) == [(50, 99)]
+
+
+def test_unsatisfiable():
+    with pytest.raises(ranges.RangeNotSatisfiable):
+        ranges.parse_range("bytes=100-", 100)
+    with pytest.raises(ranges.RangeNotSatisfiable):
+        ranges.parse_range("bytes=-0", 100)
+    with pytest.raises(ranges.RangeNotSatisfiable):
+        ranges.parse_range("bytes=0-", 0)
+
+
+def test_unsatisfiable_parts_are_dropped():
+    assert ranges.parse_range("bytes=0-9,200-300", 100) == [(0, 9)]
+
+
+def test_overlapping_and_adjacent_ranges_are_merged():
+    assert ranges.parse_range("bytes=0-,0-,0-", 100) == [(0, 99)]
+    assert ranges.parse_range("bytes=0-9,10-19", 100) == [(0, 19)]
+    assert ranges.parse_range("bytes=0-9,5-14,-10", 100) == [(0, 14), (90, 99)]
+    assert ranges.parse_range("bytes=50-59,0-9", 100) == [(0, 9), (50, 59)]
+
+
+def test_repeated_full_ranges_cost_one_pass():
+    spec = ",".join(["0-"] * ranges.MAX_RANGES)
+    assert ranges.parse_range(f"bytes={spec}", 30 * 1024 ** 3) == [(0, 30 * 1024 ** 3 - 1)]
+
+
+def test_too_many_ranges_serves_in_full():
+    spec = ",".join(f"{i * 2}-{i * 2}" for i in range(ranges.MAX_RANGES + 1))
+    assert ranges.parse_range(f"bytes={spec}", 1000) is None
+
+
+def test_byteranges_layout_length_matches_body():
+    requested = [(0, 9), (50, 59)]
+    headers, trailer, length = ranges.byteranges_layout(requested, 100, "text/plain", "b")
+    assert headers[0] == (
+        b"--b\r\nContent-Type: text/plain\r\nContent-Range: bytes 0-9/100\r\n\r\n"
+    )
+    assert trailer == b"--b--\r\n"
+
+    data = bytes(range(100))
+    body = b"".join(
+        header + data[start:end + 1] + b"\r\n"
+        for header, (start, end) in zip(headers, requested)
+    ) + trailer
+    assert len(body) == length